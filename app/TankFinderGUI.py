@@ -2,6 +2,9 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import os, re, sqlite3, subprocess, threading, time, json, sys, urllib.parse
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from search_sql import build_match_expr, year_filters  # shared with search.py
 
 # ------------------ DB path + single-instance ------------------
 
@@ -43,11 +46,39 @@ def connect_db_ro(db_path: Path | str | None = None) -> sqlite3.Connection:
     con = sqlite3.connect(uri, uri=True, timeout=30, isolation_level=None)
     con.execute("PRAGMA query_only=ON;")
     con.execute("PRAGMA busy_timeout=8000;")  # brief retry if indexer is mid-commit
+    tune_read_connection(con, Path(p))
     return con
 
 # If any GUI code calls connect_db(...), force it to use the RO connector.
 connect_db = connect_db_ro
 
+def is_local_disk(p: Path) -> bool:
+    """True if p lives on a fixed local drive. UNC paths and mapped/removable drives are not."""
+    s = str(p)
+    if s.startswith(("\\\\", "//")):
+        return False
+    if sys.platform != "win32":
+        return True
+    try:
+        import ctypes
+        DRIVE_FIXED = 3
+        return ctypes.windll.kernel32.GetDriveTypeW(p.resolve().anchor) == DRIVE_FIXED
+    except Exception:
+        return False
+
+def tune_read_connection(con: sqlite3.Connection, db_path: Path) -> None:
+    """Read-side cache knobs for the search connection (the indexer sets WAL/synchronous)."""
+    pragmas = ["PRAGMA cache_size=-131072;",   # 128 MiB page cache
+               "PRAGMA temp_store=MEMORY;"]     # sorts/DISTINCT temp b-trees in RAM
+    # mmap over SMB can hand back stale or torn pages; only map a DB on a local disk
+    if is_local_disk(db_path):
+        pragmas.append(f"PRAGMA mmap_size={1 << 33};")
+    for pragma in pragmas:
+        try:
+            con.execute(pragma)
+        except Exception:
+            pass
+
 # ---- Single-instance guard (Windows named mutex) ----
 # ---- Single-instance guard (Windows named mutex, session-local) ----
 def enforce_single_instance(name: str = r"Local\SavTank_TankFinder_GUI") -> None:
@@ -127,37 +158,6 @@ def index_refreshing() -> bool:
 
 # ------------------ helpers ------------------
 
-_NON_ALNUM = re.compile(r"[^a-z0-9]+")
-
-def build_match_expr(q: str, use_near: bool) -> str:
-    toks = [t for t in re.split(r"\W+", (q or "").lower()) if t]
-    if not toks:
-        return ""
-    if use_near and len(toks) >= 2:
-        expr = f"\"{toks[0]}\""
-        for t in toks[1:]:
-            expr += f" NEAR \"{t}\""
-        return expr
-    return " AND ".join(f"\"{t}\"" for t in toks)
-
-def year_filters(years: str | None):
-    if not years:
-        return []
-    parts = []
-    for chunk in years.split(","):
-        c = chunk.strip()
-        if "-" in c:
-            a, b = c.split("-", 1)
-            try:
-                a = int(a); b = int(b)
-                for y in range(min(a, b), max(a, b) + 1):
-                    parts.append(str(y))
-            except Exception:
-                pass
-        elif c.isdigit():
-            parts.append(c)
-    return [f"j.root_path LIKE '%\\{y}\\%'" for y in sorted(set(parts))]
-
 # ---- robust path + open helpers (long/UNC safe) ----
 def _norm(p: Path) -> Path:
     return Path(os.path.normpath(str(p)))
@@ -349,7 +349,7 @@ class App(tk.Tk):
             values=["All","PDFs","CAD","COMPRESS","API","EXCEL"], state="readonly"
         )
         self.file_filter.pack(side=tk.LEFT, padx=(4, 0))
-        self.file_filter.bind("<<ComboboxSelected>>", lambda e: self.refresh_file_list())
+        self.file_filter.bind("<<ComboboxSelected>>", lambda e: self._schedule_refresh())
 
         files_wrap = ttk.Frame(right)
         files_wrap.pack(fill=tk.BOTH, expand=True)
@@ -445,21 +445,41 @@ class App(tk.Tk):
             # Use immutable=1 to hint SQLite this file won’t change (faster on network)
             return "file:" + p.resolve().as_posix() + "?mode=ro&immutable=1"
 
-        try:
-            # Keep timeout small so we don't hang forever if the share hiccups
-            self.con = sqlite3.connect(_uri(dbp), uri=True, timeout=2.0)
-        except Exception:
+        def _open_ro() -> sqlite3.Connection:
             try:
-                self.con = sqlite3.connect(str(dbp), timeout=2.0)
-            except Exception as e:
-                messagebox.showerror("TankFinder", f"Couldn't open database:\n{dbp}\n\n{e}")
-                self.destroy(); return
+                # Keep timeout small so we don't hang forever if the share hiccups
+                con = sqlite3.connect(_uri(dbp), uri=True, timeout=2.0)
+            except Exception:
+                con = sqlite3.connect(str(dbp), timeout=2.0)
+            try:
+                con.execute("PRAGMA query_only=ON;")
+            except Exception:
+                pass
+            tune_read_connection(con, dbp)
+            con.row_factory = sqlite3.Row
+            return con
 
         try:
-            self.con.execute("PRAGMA query_only=ON;")
-        except Exception:
-            pass
-        self.con.row_factory = sqlite3.Row
+            self.con = _open_ro()
+        except Exception as e:
+            messagebox.showerror("TankFinder", f"Couldn't open database:\n{dbp}\n\n{e}")
+            self.destroy(); return
+
+        # searches/file lists run on worker threads, each with its own connection,
+        # so a slow FTS query never freezes the window
+        self._open_ro = _open_ro
+        self._tls = threading.local()
+        self._query_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tf-query")
+        self._query_seq = {"search": 0, "files": 0}
+        self._pending_refresh = None  # after() id of a debounced refresh_file_list
+        # per-job counts precomputed by the indexer (older DBs fall back to counting per search)
+        self.has_job_stats = self.con.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='job_file_stats'").fetchone() is not None
+        # indexed COMPRESS/API flags on files (older DBs fall back to instr() on detector_hits)
+        files_cols = {r[1] for r in self.con.execute("PRAGMA table_info(files)")}
+        self.has_file_flags = "is_compress" in files_cols
+        # FTS rowid == files.id on current DBs: join on the integer key instead of the text hash
+        self.fts_on = "ff.rowid = f.id" if "id" in files_cols else "ff.file_hash16 = f.file_hash16"
         self.status.set("READY")
         print("[TankFinder] DB opened OK.")
 
@@ -475,6 +495,54 @@ class App(tk.Tk):
         if hasattr(self, "status_var"):
             self.status_var.set("")
 
+    def _query_con(self) -> sqlite3.Connection:
+        # one read-only connection per worker thread (sqlite3 connections stay on their thread)
+        con = getattr(self._tls, "con", None)
+        if con is None:
+            con = self._tls.con = self._open_ro()
+        return con
+
+    def _run_query(self, slot: str, work, done):
+        """
+        Run work(con) on the query pool and hand (result, error) to done() on the Tk thread.
+        A newer request on the same slot ("search" / "files") makes older results stale.
+        """
+        self._query_seq[slot] += 1
+        seq = self._query_seq[slot]
+
+        def task():
+            try:
+                res, err = work(self._query_con()), None
+            except Exception as e:
+                res, err = None, e
+            def deliver():
+                if self._query_seq[slot] == seq:
+                    done(res, err)
+            try:
+                self.after(0, deliver)
+            except RuntimeError:
+                pass  # window already closed
+
+        self._query_pool.submit(task)
+
+    def _fill_tree(self, tree: ttk.Treeview, items: list, slot: str, chunk: int = 200):
+        """
+        Replace tree's rows with items [(iid, values)], inserting `chunk` rows per idle
+        callback so the window stays responsive; stops early once `slot` has a newer query.
+        """
+        tree.delete(*tree.get_children())
+        seq = self._query_seq[slot]
+
+        def step(start: int):
+            if self._query_seq[slot] != seq:
+                return
+            for iid, values in items[start:start + chunk]:
+                tree.insert("", "end", iid=iid, values=values)
+            if start + chunk < len(items):
+                self.after_idle(step, start + chunk)
+
+        step(0)
+
     def _clear_tree(self, tree: ttk.Treeview):
         for iid in tree.get_children():
             tree.delete(iid)
@@ -495,7 +563,9 @@ class App(tk.Tk):
         if hasattr(self, "show_var"):        self.show_var.set("All")
         if hasattr(self, "file_filter_var"): self.file_filter_var.set("All")
 
-        # tables
+        # tables (and drop any query/fill still in flight)
+        if hasattr(self, "_query_seq"):
+            for slot in self._query_seq: self._query_seq[slot] += 1
         if hasattr(self, "jobs"):  self._clear_tree(self.jobs)
         if hasattr(self, "files"): self._clear_tree(self.files)
 
@@ -559,11 +629,11 @@ class App(tk.Tk):
 
         # FTS join/predicate
         if q:
-            fts_join = "JOIN fts_files ff ON ff.file_hash16 = f.file_hash16"
+            fts_join = f"JOIN fts_files ff ON {self.fts_on}"
             fts_pred = "ff.content MATCH ?"
             params.append(match_expr)
         else:
-            fts_join = "LEFT JOIN fts_files ff ON ff.file_hash16 = f.file_hash16"
+            fts_join = ""  # no text query: the FTS table isn't needed at all
             fts_pred = "1=1"
 
         # quick filters
@@ -572,8 +642,10 @@ class App(tk.Tk):
         if self.cad_var.get():      where.append("j.has_dwg_dxf = 1")
         if self.pdf_var.get():      where.append("j.has_pdf = 1")
 
-        ylikes = year_filters(self.years_var.get())
-        if ylikes: where.append("(" + " OR ".join(ylikes) + ")")
+        yf = year_filters(self.years_var.get())
+        if yf:
+            where.append(yf[0])
+            params.extend(yf[1])
 
         # SHOW filter (ALL/JOBS/QUOTES)
         show = (self.show_var.get() if hasattr(self, "show_var") else "ALL").upper()
@@ -583,69 +655,102 @@ class App(tk.Tk):
             where.append("j.job_id LIKE 'Q%'")
 
         where_sql = " AND ".join([fts_pred] + where) if where else fts_pred
+        # one row per file already (unique file_hash16, at most one FTS row per rowid), so the
+        # count needs no DISTINCT pass; the hash join of older DBs may see duplicate FTS rows
+        n_hits = "COUNT(*)" if not q or self.fts_on == "ff.rowid = f.id" else "COUNT(DISTINCT f.file_hash16)"
+        per_job = f"""
+            SELECT f.job_id, {n_hits} AS n_hits
+            FROM files f
+            {fts_join}
+            JOIN jobs j ON j.job_id=f.job_id
+            WHERE f.deleted=0 AND {where_sql}
+            GROUP BY f.job_id"""
 
-        sql = f"""
-        WITH hits AS (
-        SELECT DISTINCT f.job_id, f.file_hash16
-        FROM files f
-        {fts_join}
-        JOIN jobs j ON j.job_id=f.job_id
-        WHERE f.deleted=0 AND {where_sql}
-        )
-        SELECT
-        j.job_id, j.root_path,
-        j.has_compress, j.has_ame, j.has_dwg_dxf, j.has_pdf,
-        COUNT(h.file_hash16) AS n_hits,
-        (SELECT COUNT(*) FROM files x WHERE x.job_id=j.job_id AND x.deleted=0 AND x.ext='.pdf') AS n_pdf,
-        (SELECT COUNT(*) FROM files x WHERE x.job_id=j.job_id AND x.deleted=0 AND x.ext IN('.dwg','.dxf')) AS n_cad,
-        (SELECT COUNT(*) FROM files x WHERE x.job_id=j.job_id AND x.deleted=0 AND (
-            instr(x.detector_hits,'compress')>0 OR x.ext IN('.cw7','.xml','.out','.lst','.txt','.html','.htm'))) AS n_compress,
-        (SELECT COUNT(*) FROM files x WHERE x.job_id=j.job_id AND x.deleted=0 AND (
-            instr(x.detector_hits,'ametank')>0 OR x.ext IN('.mdl','.xmt_txt','.amz','.txt','.html','.htm'))) AS n_ame
-        FROM hits h
-        JOIN jobs j ON j.job_id=h.job_id
-        GROUP BY j.job_id, j.root_path, j.has_compress, j.has_ame, j.has_dwg_dxf, j.has_pdf
-        ORDER BY n_hits DESC, j.job_id
-        LIMIT ?
-        """
+        if self.has_job_stats:
+            sql = f"""
+            WITH per_job AS ({per_job}
+            )
+            SELECT
+            j.job_id, j.root_path,
+            j.has_compress, j.has_ame, j.has_dwg_dxf, j.has_pdf,
+            p.n_hits,
+            COALESCE(s.n_pdf, 0) AS n_pdf,
+            COALESCE(s.n_cad, 0) AS n_cad,
+            COALESCE(s.n_compress, 0) AS n_compress,
+            COALESCE(s.n_ame, 0) AS n_ame
+            FROM per_job p
+            JOIN jobs j ON j.job_id=p.job_id
+            LEFT JOIN job_file_stats s ON s.job_id=p.job_id
+            ORDER BY p.n_hits DESC, j.job_id
+            LIMIT ?
+            """
+        else:
+            sql = f"""
+            WITH per_job AS ({per_job}
+            )
+            SELECT
+            j.job_id, j.root_path,
+            j.has_compress, j.has_ame, j.has_dwg_dxf, j.has_pdf,
+            p.n_hits,
+            (SELECT COUNT(*) FROM files x WHERE x.job_id=j.job_id AND x.deleted=0 AND x.ext='.pdf') AS n_pdf,
+            (SELECT COUNT(*) FROM files x WHERE x.job_id=j.job_id AND x.deleted=0 AND x.ext IN('.dwg','.dxf')) AS n_cad,
+            (SELECT COUNT(*) FROM files x WHERE x.job_id=j.job_id AND x.deleted=0 AND (
+                instr(x.detector_hits,'compress')>0 OR x.ext IN('.cw7','.xml','.out','.lst','.txt','.html','.htm'))) AS n_compress,
+            (SELECT COUNT(*) FROM files x WHERE x.job_id=j.job_id AND x.deleted=0 AND (
+                instr(x.detector_hits,'ametank')>0 OR x.ext IN('.mdl','.xmt_txt','.amz','.txt','.html','.htm'))) AS n_ame
+            FROM per_job p
+            JOIN jobs j ON j.job_id=p.job_id
+            ORDER BY p.n_hits DESC, j.job_id
+            LIMIT ?
+            """
 
-        def _fill_jobs(rows):
-            self.jobs.delete(*self.jobs.get_children())
-            for r in rows:
-                badges = []
-                if r["has_compress"]: badges.append("COMPRESS")
-                if r["has_ame"]:      badges.append("API")
-                if r["has_dwg_dxf"]:  badges.append("CAD")
-                if r["has_pdf"]:      badges.append("PDF")
-                # Quote badge if a quote job has at least one PDF
-                if str(r["job_id"]).upper().startswith("Q") and r["n_pdf"] > 0:
-                    badges.append("QUOTE.PDF")
-                self.jobs.insert(
-                    "", "end", iid=r["job_id"],
-                    values=(r["job_id"], r["n_hits"], r["n_pdf"], r["n_cad"], r["n_compress"], r["n_ame"],
-                            ", ".join(badges) or "-", r["root_path"])
-                )
+        def _job_item(r):
+            badges = []
+            if r["has_compress"]: badges.append("COMPRESS")
+            if r["has_ame"]:      badges.append("API")
+            if r["has_dwg_dxf"]:  badges.append("CAD")
+            if r["has_pdf"]:      badges.append("PDF")
+            # Quote badge if a quote job has at least one PDF
+            if str(r["job_id"]).upper().startswith("Q") and r["n_pdf"] > 0:
+                badges.append("QUOTE.PDF")
+            return r["job_id"], (r["job_id"], r["n_hits"], r["n_pdf"], r["n_cad"], r["n_compress"], r["n_ame"],
+                                 ", ".join(badges) or "-", r["root_path"])
 
         try:
-            rows = self.con.execute(sql, (*params, int(self.limit_var.get()))).fetchall()
-            _fill_jobs(rows)
-            self.files.delete(*self.files.get_children())
+            limit = int(self.limit_var.get())
         except Exception as e:
             messagebox.showerror("Query error", str(e))
             self.status.set("ERROR")
             return
 
-        # NEAR fallback → AND
-        if used_near and not rows:
-            try:
-                match_and = build_match_expr(q, use_near=False)
-                rows2 = self.con.execute(sql, (match_and, int(self.limit_var.get()))).fetchall()
-            except Exception:
-                rows2 = []
-            _fill_jobs(rows2)
-            self.status.set(f"No NEAR hits; fell back to AND — {len(rows2)} job(s)")
-        else:
-            self.status.set(f"{len(rows)} job(s)")
+        def work(con):
+            rows = con.execute(sql, (*params, limit)).fetchall()
+            rows2 = None
+            # NEAR fallback → AND
+            if used_near and not rows:
+                try:
+                    match_and = build_match_expr(q, use_near=False)
+                    rows2 = con.execute(sql, (match_and, *params[1:], limit)).fetchall()
+                except Exception:
+                    rows2 = []
+            # row values are built here so the Tk thread only does inserts
+            return [_job_item(r) for r in (rows if rows2 is None else rows2)], rows2 is not None
+
+        def done(res, err):
+            if err is not None:
+                messagebox.showerror("Query error", str(err))
+                self.status.set("ERROR")
+                return
+            items, fell_back = res
+            self._query_seq["files"] += 1  # a file list still loading belongs to the old results
+            self._fill_tree(self.jobs, items, "search")
+            self.files.delete(*self.files.get_children())
+            if fell_back:
+                self.status.set(f"No NEAR hits; fell back to AND — {len(items)} job(s)")
+            else:
+                self.status.set(f"{len(items)} job(s)")
+
+        self._run_query("search", work, done)
 
 
     def _file_filter_sql(self):
@@ -653,6 +758,8 @@ class App(tk.Tk):
         if choice == "All":       return "1=1"
         if choice == "PDFs":      return "f.ext='.pdf'"
         if choice == "CAD":       return "f.ext IN('.dwg','.dxf')"
+        if choice == "COMPRESS" and self.has_file_flags: return "f.is_compress=1"
+        if choice == "API" and self.has_file_flags:      return "f.is_ame=1"
         if choice == "COMPRESS":  return "(instr(f.detector_hits,'compress')>0 OR f.ext IN('.cw7','.xml','.out','.lst','.txt','.html','.htm'))"
         if choice == "API":       return "(instr(f.detector_hits,'ametank')>0 OR f.ext IN('.mdl','.xmt_txt','.amz','.txt','.html','.htm'))"
         if choice == "Text":      return "f.ext IN('.txt','.xml','.html','.htm','.xmt_txt','.csv')"
@@ -660,11 +767,22 @@ class App(tk.Tk):
         return "1=1"
 
     def on_job_select(self, *_):
+        self._schedule_refresh()
+
+    def _schedule_refresh(self, delay_ms: int = 150):
+        # arrowing through the job list fires a select per row; only query once it settles
+        if self._pending_refresh:
+            self.after_cancel(self._pending_refresh)
+        self._pending_refresh = self.after(delay_ms, self._run_pending_refresh)
+
+    def _run_pending_refresh(self):
+        self._pending_refresh = None
         self.refresh_file_list()
 
     def refresh_file_list(self):
         sel = self.jobs.selection()
         if not sel:
+            self._query_seq["files"] += 1
             self.files.delete(*self.files.get_children()); return
         job_id = sel[0]
         q = self.q_var.get().strip()
@@ -674,7 +792,7 @@ class App(tk.Tk):
             sql = f"""
             SELECT f.rel_path
             FROM files f
-            JOIN fts_files ff ON ff.file_hash16 = f.file_hash16
+            JOIN fts_files ff ON {self.fts_on}
             WHERE f.deleted=0 AND f.job_id=? AND ff.content MATCH ? AND {pred}
             ORDER BY f.rel_path
             LIMIT 1000
@@ -689,16 +807,22 @@ class App(tk.Tk):
             LIMIT 1000
             """
             params = (job_id,)
-        self.files.delete(*self.files.get_children())
-        for fr in self.con.execute(sql, params):
-            self.files.insert("", "end", values=(fr["rel_path"],))
+
+        def done(rows, err):
+            if err is not None:
+                messagebox.showerror("Query error", str(err)); return
+            self._fill_tree(self.files, rows, "files")
+
+        self._run_query("files", lambda con: [(None, (r["rel_path"],)) for r in con.execute(sql, params)], done)
 
     # --- job/file actions ---
     def get_selected_job_root(self) -> Path | None:
         sel = self.jobs.selection()
         if not sel: return None
-        row = self.con.execute("SELECT root_path FROM jobs WHERE job_id=?", (sel[0],)).fetchone()
-        return Path(row["root_path"]) if row else None
+        # the jobs row already carries root_path; no query (and no wait on a busy writer)
+        vals = self.jobs.item(sel[0], "values")
+        root = vals[self.job_cols.index("root_path")] if vals else ""
+        return Path(root) if root else None
 
     def on_open_job(self, *_):
         root = self.get_selected_job_root()
@@ -827,15 +951,11 @@ class App(tk.Tk):
             try:
                 cmd = [os.fspath(Path(os.sys.executable)), os.fspath(INDEXER)]
                 # quick pass: keep as-is (you can extend with flags later)
-                proc = subprocess.Popen(cmd, cwd=os.fspath(ROOT), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-                last_line = ""
-                while True:
-                    line = proc.stdout.readline()
-                    if not line:
-                        if proc.poll() is not None: break
-                        time.sleep(0.1); continue
-                    last_line = line.strip()
-                    self.status.set(fmt_status(last_line))
+                # line-buffered pipe: the loop blocks until the indexer emits a line, ends at EOF
+                proc = subprocess.Popen(cmd, cwd=os.fspath(ROOT), stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                        text=True, bufsize=1)
+                for line in proc.stdout:
+                    self.status.set(fmt_status(line.strip()))
                 code = proc.wait()
                 if code == 0:
                     self.status.set("Index refresh complete")
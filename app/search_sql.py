@@ -0,0 +1,56 @@
+"""
+Query-building helpers shared by the GUI (app/TankFinderGUI.py) and the CLI (search.py),
+so both turn the same input into the same FTS MATCH expression and year predicate.
+"""
+import re
+
+# query terms: Unicode word runs, matching the unicode61 FTS tokenizer (findall yields no empties)
+QUERY_TOKEN_RE = re.compile(r"\w+")
+
+def build_match_expr(q: str, use_near: bool) -> str:
+    """
+    Build an FTS5 MATCH expression.
+    - use_near chains terms with plain NEAR (default distance; some SQLite builds error on
+      "NEAR/N" via bound params).
+    - Otherwise AND all tokens.
+    """
+    toks = QUERY_TOKEN_RE.findall((q or "").lower())
+    if not toks:
+        return ""
+    if use_near and len(toks) >= 2:
+        expr = f"\"{toks[0]}\""
+        for t in toks[1:]:
+            expr += f" NEAR \"{t}\""
+        return expr
+    return " AND ".join(f"\"{t}\"" for t in toks)
+
+def year_filters(years: str | None) -> tuple[str, list[int]] | None:
+    """
+    '2019-2022,2024' -> (predicate on the indexed jobs.job_year, params), or None.
+    Years collapse into inclusive (lo, hi) runs, one BETWEEN each, so the SQL text depends
+    only on the number of runs, not on how many years they span.
+    """
+    if not years:
+        return None
+    spans = []
+    for chunk in years.split(","):
+        c = chunk.strip()
+        if "-" in c:
+            a, b = c.split("-", 1)
+            try:
+                a = int(a); b = int(b)
+            except ValueError:
+                continue
+            spans.append((min(a, b), max(a, b)))
+        elif c.isdigit():
+            spans.append((int(c), int(c)))
+    if not spans:
+        return None
+    runs = []
+    for lo, hi in sorted(spans):
+        if runs and lo <= runs[-1][1] + 1:
+            runs[-1][1] = max(runs[-1][1], hi)
+        else:
+            runs.append([lo, hi])
+    pred = " OR ".join(["j.job_year BETWEEN ? AND ?"] * len(runs))
+    return (pred if len(runs) == 1 else f"({pred})"), [y for run in runs for y in run]
@@ -11,25 +11,31 @@ Key features
 CLI
   py -3 indexer\indexer.py --year-min 2015 --year-max 2100
   py -3 indexer\indexer.py --quotes-only
+  py -3 indexer\indexer.py --skip-text        # metadata only; PDF text on the next run
   py -3 indexer\indexer.py --rebuild-fts --year-min 2015 --year-max 2100
+  py -3 indexer\indexer.py --rebuild-hashes   # move an older (SHA-1 keyed) DB to xxh3 keys
+
+  Very large scans on Linux: a system allocator keeps RSS flatter than pymalloc
+  PYTHONMALLOC=malloc LD_PRELOAD=/usr/lib/libmimalloc.so python3 indexer/indexer.py
 
 Config (config.yaml)
   roots: ["P:\\JOBS", "P:\\ARCHIVES\\OLD JOBS"]
   quotes_roots: ["P:\\QUOTES"]
   quotes_scan: {year_min: 2022, year_max: 2100}
   job_id_regex: "(?P<job>\\b\\d{3}-\\d{2}\\b)"
-  scan_policy: {...}
-  pdf_text: {enabled: true, path_allow_tokens: [...], max_pages: 10, max_chars: 40000}
+  scan_policy: {..., workers: 8}
+  pdf_text: {enabled: true, path_allow_tokens: [...], max_pages: 10, max_chars: 40000, workers: 8}
   office_text: {enabled: false, include: [...], ...}
   ignore: {ext: [...], dir_tokens: [...]}
 """
 
 from __future__ import annotations
-import argparse, hashlib, os, re, sqlite3, sys, time
-from dataclasses import dataclass
+import argparse, hashlib, multiprocessing, os, re, sqlite3, sys, time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, Iterator, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 import yaml
 from tqdm import tqdm
 
@@ -43,11 +49,21 @@ try:
 except Exception:
     fitz = None
 
+# -------- Optional fast path-key hashing --------
+try:
+    import xxhash
+except Exception:
+    xxhash = None
+
 # -------- Optional Office parsing (off by default via YAML) --------
 try:
     import openpyxl
 except Exception:
     openpyxl = None
+try:
+    from python_calamine import CalamineWorkbook  # Rust reader: faster, and reads .xls/.xlsb too
+except Exception:
+    CalamineWorkbook = None
 try:
     from docx import Document
 except Exception:
@@ -105,6 +121,7 @@ def release_lock(lock_path: Path) -> None:
 # e.g., Q9185, Q9185.2 — with word boundaries so we don't match part of another token
 QNUM_RE     = re.compile(r"(?i)(?<!\w)q(?P<num>\d{4,6})(?:\.(?P<ver>\d+))?(?!\w)")
 YEAR_DIR_RE = re.compile(r"^(19|20)\d{2}$", re.I)
+YEAR_IN_PATH_RE = re.compile(r"[\\/]((?:19|20)\d{2})(?=[\\/]|$)")  # a YYYY folder in a root path
 
 
 # ================= util =================
@@ -114,12 +131,48 @@ def utc_iso(ts: float) -> str:
 def now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
+# file_hash16 keys: the algorithm a DB was built with is kept in PRAGMA user_version
+# (0 = SHA-1, the original) so keys never mix. New DBs get the fastest available one.
+HASH_SHA1, HASH_XXH3, HASH_BLAKE2B = 0, 1, 2
+
 def file_hash16(s: str) -> str:
     return hashlib.sha1(s.encode("utf-8", errors="ignore")).hexdigest()[:16]
 
-_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+def file_hash16_xxh3(s: str) -> str:
+    return xxhash.xxh3_64_hexdigest(s.encode("utf-8", errors="ignore"))
+
+def file_hash16_blake2b(s: str) -> str:
+    return hashlib.blake2b(s.encode("utf-8", errors="ignore"), digest_size=8).hexdigest()
+
+HASH_FUNCS = {HASH_SHA1: file_hash16, HASH_XXH3: file_hash16_xxh3, HASH_BLAKE2B: file_hash16_blake2b}
+
+def preferred_hash_algo() -> int:
+    return HASH_XXH3 if xxhash is not None else HASH_BLAKE2B
+
+def select_hash_algo(con: sqlite3.Connection, persist: bool = True) -> int:
+    algo = con.execute("PRAGMA user_version;").fetchone()[0]
+    empty = not (con.execute("SELECT 1 FROM files LIMIT 1").fetchone()
+                 or con.execute("SELECT 1 FROM file_text LIMIT 1").fetchone())
+    if algo == HASH_SHA1 and empty:
+        algo = preferred_hash_algo()
+        if persist:
+            con.execute(f"PRAGMA user_version={algo};")
+    if algo not in HASH_FUNCS:
+        raise SystemExit(f"[indexer] DB uses unknown file-key algorithm (user_version={algo})")
+    if algo == HASH_XXH3 and xxhash is None:
+        raise SystemExit("[indexer] DB uses xxh3 file keys but xxhash is not installed (pip install xxhash)")
+    return algo
+
+def compile_token_re(tokens) -> Optional[re.Pattern]:
+    # one alternation scans the string once for any literal token (None when empty)
+    toks = sorted({t.lower() for t in tokens if t}, key=len, reverse=True)
+    return re.compile("|".join(re.escape(t) for t in toks)) if toks else None
+
+# [a-z0-9] bytes map to themselves, every other byte to a space; non-ASCII encodes as "?"
+# so it separates tokens exactly like the old [^a-z0-9]+ split, without a regex engine.
+_TOKEN_XLATE = bytes(c if (48 <= c <= 57 or 97 <= c <= 122) else 32 for c in range(256))
 def norm_tokens(s: str) -> List[str]:
-    return [t for t in _NON_ALNUM.split(s.lower()) if t]
+    return s.lower().encode("ascii", "replace").translate(_TOKEN_XLATE).decode("ascii").split()
 
 def load_cfg() -> dict:
     with open(CFG_PATH, "r", encoding="utf-8") as f:
@@ -160,6 +213,8 @@ def connect_db(db_path: str | os.PathLike) -> sqlite3.Connection:
         "PRAGMA synchronous=NORMAL;",
         "PRAGMA temp_store=MEMORY;",
         "PRAGMA mmap_size=30000000000;",  # ok if it no-ops on some systems
+        "PRAGMA cache_size=-200000;",      # ~200 MB page cache for the scan
+        "PRAGMA wal_autocheckpoint=10000;",  # checkpoint less often during big batches
     ):
         try:
             con.execute(pragma)
@@ -168,9 +223,142 @@ def connect_db(db_path: str | os.PathLike) -> sqlite3.Connection:
 
     return con
 
+# rows per write transaction; each COMMIT is a WAL fsync, which is slow on P:\
+BATCH_ROWS = 5000
+
+def begin_write(con: sqlite3.Connection) -> None:
+    # connection is autocommit, so group writes explicitly; commit with con.commit()
+    if not con.in_transaction:
+        con.execute("BEGIN IMMEDIATE;")
+
+
+# files with an explicit INTEGER PRIMARY KEY (same DDL as schema.sql); used to rebuild older
+# tables that were keyed by file_hash16 alone. Columns added later via ALTER are carried over.
+FILES_DDL = """
+    CREATE TABLE {name} (
+      id            INTEGER PRIMARY KEY,
+      file_hash16   TEXT NOT NULL UNIQUE,
+      job_id        TEXT NOT NULL,
+      rel_path      TEXT NOT NULL,
+      ext           TEXT NOT NULL,
+      size_bytes    INTEGER NOT NULL,
+      mtime_utc     TEXT NOT NULL,
+      kind          TEXT,
+      tokens_fname  TEXT,
+      detector_hits TEXT,
+      deleted       INTEGER NOT NULL DEFAULT 0 CHECK (deleted IN (0,1)),
+      FOREIGN KEY (job_id) REFERENCES jobs(job_id) ON DELETE CASCADE
+    );
+"""
+
+# FTS: external-content index over file_text, kept in sync by triggers (same DDL as schema.sql).
+# file_text.id is the file's files.id, so a MATCH rowid is a direct primary-key probe into files.
+FILE_TEXT_DDL = """
+    CREATE TABLE IF NOT EXISTS file_text (
+      id          INTEGER PRIMARY KEY,
+      file_hash16 TEXT NOT NULL UNIQUE,
+      content     TEXT
+    );
+"""
+FTS_DDL = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS fts_files USING fts5(
+      content,
+      file_hash16 UNINDEXED,
+      content = 'file_text',
+      content_rowid = 'id',
+      tokenize = "unicode61 separators '-_./()[]{}' remove_diacritics 2"
+    );
+"""
+FTS_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS file_text_ai AFTER INSERT ON file_text BEGIN
+         INSERT INTO fts_files(rowid, content, file_hash16) VALUES (new.id, new.content, new.file_hash16);
+       END;""",
+    """CREATE TRIGGER IF NOT EXISTS file_text_ad AFTER DELETE ON file_text BEGIN
+         INSERT INTO fts_files(fts_files, rowid, content, file_hash16) VALUES ('delete', old.id, old.content, old.file_hash16);
+       END;""",
+    """CREATE TRIGGER IF NOT EXISTS file_text_au AFTER UPDATE ON file_text BEGIN
+         INSERT INTO fts_files(fts_files, rowid, content, file_hash16) VALUES ('delete', old.id, old.content, old.file_hash16);
+         INSERT INTO fts_files(rowid, content, file_hash16) VALUES (new.id, new.content, new.file_hash16);
+       END;""",
+)
+FTS_TRIGGER_NAMES = ("file_text_ai", "file_text_ad", "file_text_au")
+
+def drop_fts_triggers(con: sqlite3.Connection) -> None:
+    for trg in FTS_TRIGGER_NAMES:
+        con.execute(f"DROP TRIGGER IF EXISTS {trg};")
+
+def rebuild_fts_index(con: sqlite3.Connection) -> None:
+    # one sequential pass over file_text, then back to per-row trigger upkeep
+    con.execute("INSERT INTO fts_files(fts_files) VALUES ('rebuild');")
+    for trg in FTS_TRIGGERS:
+        con.execute(trg)
+
+# Per-job file counts for the GUI's #PDF/#CAD/#COMPRESS/#API columns. COMPRESS/API also
+# count loose result/text files, matching the GUI's file filters.
+JOB_FILE_STATS_DDL = """
+    CREATE TABLE IF NOT EXISTS job_file_stats (
+      job_id     TEXT PRIMARY KEY REFERENCES jobs(job_id) ON DELETE CASCADE,
+      n_pdf      INTEGER NOT NULL DEFAULT 0,
+      n_cad      INTEGER NOT NULL DEFAULT 0,
+      n_compress INTEGER NOT NULL DEFAULT 0,
+      n_ame      INTEGER NOT NULL DEFAULT 0
+    );
+"""
+JOB_FILE_COUNTS_SQL = """
+    COALESCE(SUM(ext='.pdf'), 0),
+    COALESCE(SUM(ext IN ('.dwg','.dxf')), 0),
+    COALESCE(SUM(is_compress), 0),
+    COALESCE(SUM(is_ame), 0)
+"""
+
+def add_files_id(con: sqlite3.Connection) -> None:
+    """Rebuild a files table keyed by file_hash16 alone so it has an INTEGER PRIMARY KEY id."""
+    old = con.execute("PRAGMA table_info(files)").fetchall()  # (cid, name, type, notnull, dflt, pk)
+    con.execute("DROP TABLE IF EXISTS files_new;")
+    con.execute(FILES_DDL.format(name="files_new"))
+    have = {r[1] for r in con.execute("PRAGMA table_info(files_new)")}
+    for _, name, typ, notnull, dflt, _ in old:
+        if name in have:
+            continue
+        ddl = f"ALTER TABLE files_new ADD COLUMN {name} {typ}"
+        if dflt is not None:
+            ddl += (" NOT NULL" if notnull else "") + f" DEFAULT {dflt}"
+        con.execute(ddl)
+    cols = ", ".join(r[1] for r in old)
+    con.execute(f"INSERT INTO files_new ({cols}) SELECT {cols} FROM files ORDER BY rowid;")
+    con.execute("DROP TABLE files;")
+    con.execute("ALTER TABLE files_new RENAME TO files;")
+
+# secondary indexes on files (the UNIQUE file_hash16 key is part of the table itself)
+FILES_INDEXES = {
+    "idx_files_job_del_path":  "ON files(job_id, deleted, rel_path, ext, is_compress, is_ame)",
+    "idx_files_job_ext_del":   "ON files(job_id, ext, deleted)",
+    # covers the file_hash16 join (older FTS tables) and the full deletion pass without table reads
+    "idx_files_hash_jobdel":   "ON files(file_hash16, deleted, job_id)",
+    "idx_files_job_qver":      "ON files(job_id, q_version)",
+    "idx_files_bits":          "ON files(job_id, detector_bits)",
+    "idx_files_job_compress":  "ON files(job_id) WHERE is_compress=1 AND deleted=0",
+    "idx_files_job_ame":       "ON files(job_id) WHERE is_ame=1 AND deleted=0",
+}
 
+def create_files_indexes(con: sqlite3.Connection) -> None:
+    for name, spec in FILES_INDEXES.items():
+        con.execute(f"CREATE INDEX IF NOT EXISTS {name} {spec};")
+
+def drop_files_indexes(con: sqlite3.Connection) -> None:
+    # initial build: each index is built once, in one sorted pass, after the bulk load
+    # instead of row by row (an interrupted run gets them back from ensure_schema)
+    for name in FILES_INDEXES:
+        con.execute(f"DROP INDEX IF EXISTS {name};")
 
 def ensure_schema(con: sqlite3.Connection, rebuild_fts: bool = False) -> None:
+    # file_text without its triggers: a bulk text load was interrupted before its FTS rebuild
+    # (checked first, since schema.sql recreates the triggers)
+    fts_unsynced = (
+        con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='file_text'").fetchone() is not None
+        and con.execute(f"SELECT COUNT(*) FROM sqlite_master WHERE type='trigger' AND name IN "
+                        f"{_sql_in(FTS_TRIGGER_NAMES)}").fetchone()[0] < len(FTS_TRIGGER_NAMES))
+
     # Apply schema.sql if present
     if SCHEMA_PATH.exists():
         with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
@@ -182,30 +370,88 @@ def ensure_schema(con: sqlite3.Connection, rebuild_fts: bool = False) -> None:
         try: con.execute("ALTER TABLE jobs ADD COLUMN job_year INTEGER;")
         except sqlite3.OperationalError: pass
     con.execute("CREATE INDEX IF NOT EXISTS idx_jobs_year ON jobs(job_year);")
+    # the GUI's year filter reads job_year only; fill rows from before it was always set
+    missing = con.execute("SELECT job_id, root_path FROM jobs WHERE job_year IS NULL").fetchall()
+    if missing:
+        fill = []
+        for job_id, root_path in missing:
+            jy = job_year_from_job_id(job_id)
+            if jy is None:
+                m = YEAR_IN_PATH_RE.search(root_path or "")
+                jy = int(m.group(1)) if m else None
+            if jy is not None:
+                fill.append((jy, job_id))
+        con.executemany("UPDATE jobs SET job_year=? WHERE job_id=?", fill)
     con.execute("CREATE INDEX IF NOT EXISTS idx_jobs_flags ON jobs(has_compress, has_ame, has_dwg_dxf, has_pdf);")
 
     files_cols = {r[1] for r in con.execute("PRAGMA table_info(files)")}
     if "q_version" not in files_cols:
         try: con.execute("ALTER TABLE files ADD COLUMN q_version INTEGER;")
         except sqlite3.OperationalError: pass
-    con.execute("CREATE INDEX IF NOT EXISTS idx_files_job_del ON files(job_id, deleted);")
-    con.execute("CREATE INDEX IF NOT EXISTS idx_files_job_ext_del ON files(job_id, ext, deleted);")
-    con.execute("CREATE INDEX IF NOT EXISTS idx_files_hash16 ON files(file_hash16);")
-    con.execute("CREATE INDEX IF NOT EXISTS idx_files_job_qver ON files(job_id, q_version);")
+    if "detector_bits" not in files_cols:
+        try:
+            con.execute("ALTER TABLE files ADD COLUMN detector_bits INTEGER NOT NULL DEFAULT 0;")
+            # existing rows are only rewritten when they change, so derive bits once here
+            con.execute(f"UPDATE files SET detector_bits = {DETECTOR_BITS_SQL} WHERE detector_hits <> '';")
+        except sqlite3.OperationalError: pass
+    # GUI COMPRESS/API file filters as plain columns, so they can use partial indexes
+    if "is_compress" not in files_cols:
+        try:
+            con.execute("ALTER TABLE files ADD COLUMN is_compress INTEGER NOT NULL DEFAULT 0;")
+            con.execute("ALTER TABLE files ADD COLUMN is_ame INTEGER NOT NULL DEFAULT 0;")
+            con.execute(f"UPDATE files SET is_compress = {IS_COMPRESS_SQL}, is_ame = {IS_AME_SQL};")
+        except sqlite3.OperationalError: pass
+    # exact integer mtime for the unchanged-file check (NULL on rows written before it existed)
+    if "mtime_ns" not in files_cols:
+        try: con.execute("ALTER TABLE files ADD COLUMN mtime_ns INTEGER;")
+        except sqlite3.OperationalError: pass
+    # files.id (INTEGER PRIMARY KEY) doubles as the FTS rowid; older tables need a rebuild,
+    # which drops their indexes (recreated just below) and renumbers file_text (FTS section)
+    files_rekeyed = "id" not in files_cols
+    if files_rekeyed:
+        begin_write(con)
+        add_files_id(con)
+    # covers the GUI file list (rel_path order + every file filter) without touching table rows;
+    # its (job_id, deleted) prefix replaces the old idx_files_job_del (as idx_files_hash_jobdel does idx_files_hash16)
+    con.execute("DROP INDEX IF EXISTS idx_files_job_del;")
+    con.execute("DROP INDEX IF EXISTS idx_files_hash16;")
+    create_files_indexes(con)
+
+    # per-job file counts shown by the GUI; kept current by rollup_job_stats
+    con.execute(JOB_FILE_STATS_DDL)
+    if (not con.execute("SELECT 1 FROM job_file_stats LIMIT 1").fetchone()
+            and con.execute("SELECT 1 FROM files LIMIT 1").fetchone()):
+        # new table on an existing DB: jobs without changes this run would never be rolled up
+        con.execute(f"""
+          INSERT OR REPLACE INTO job_file_stats (job_id, n_pdf, n_cad, n_compress, n_ame)
+          SELECT job_id, {JOB_FILE_COUNTS_SQL} FROM files WHERE deleted=0 GROUP BY job_id;
+        """)
 
     # FTS
-    has_fts = bool(con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='fts_files'").fetchone())
-    if rebuild_fts and has_fts:
-        con.execute("DROP TABLE fts_files;")
-        has_fts = False
-    if not has_fts:
-        con.execute("""
-            CREATE VIRTUAL TABLE fts_files USING fts5(
-              content,
-              file_hash16 UNINDEXED,
-              tokenize = "unicode61 separators '-_./()[]{}' remove_diacritics 2"
-            );
-        """)
+    con.execute(FILE_TEXT_DDL)
+    row = con.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='fts_files'").fetchone()
+    legacy_fts = bool(row) and "file_text" not in row[0]
+    if legacy_fts or rebuild_fts or files_rekeyed:
+        drop_fts_triggers(con)
+        if legacy_fts and not rebuild_fts:
+            # older DBs kept the text inside fts_files itself; move it to file_text
+            con.execute("""INSERT OR REPLACE INTO file_text(id, file_hash16, content)
+                           SELECT f.id, x.file_hash16, x.content FROM fts_files x
+                           JOIN files f ON f.file_hash16 = x.file_hash16;""")
+        if rebuild_fts:
+            con.execute("DELETE FROM file_text;")
+        elif files_rekeyed:
+            # renumber file_text to the new files.id (via negatives, so no id collides midway)
+            con.execute("DELETE FROM file_text WHERE file_hash16 NOT IN (SELECT file_hash16 FROM files);")
+            con.execute("UPDATE file_text SET id = -(SELECT f.id FROM files f WHERE f.file_hash16 = file_text.file_hash16);")
+            con.execute("UPDATE file_text SET id = -id;")
+        if legacy_fts or rebuild_fts:
+            con.execute("DROP TABLE IF EXISTS fts_files;")
+    con.execute(FTS_DDL)
+    if (legacy_fts or files_rekeyed or fts_unsynced) and not rebuild_fts:
+        con.execute("INSERT INTO fts_files(fts_files) VALUES ('rebuild');")
+    for trg in FTS_TRIGGERS:
+        con.execute(trg)
     con.commit()
 
 # ================= detectors =================
@@ -220,36 +466,47 @@ DEFAULT_DETECTORS = {
     "archive":    {"ext_any": {".zip",".7z",".rar"}},
     "legacy_calc":{"ext_any": {".wk1",".wk3",".wk4",".fmt",".prn"}},
 }
+# detectors the job rollup tests, as bits in files.detector_bits
+DETECTOR_BITS = {"pdf": 1, "cad": 2, "compress": 4, "ametank": 8, "legacy_calc": 16}
+DETECTOR_BITS_SQL = " | ".join(
+    f"(CASE WHEN instr(detector_hits,'{label}')>0 THEN {bit} ELSE 0 END)" for label, bit in DETECTOR_BITS.items())
+
+# files.is_compress / files.is_ame: the GUI's COMPRESS/API file filters (detector hit, or a
+# loose result/text file), computed at index time instead of per query
+COMPRESS_FILE_EXTS = (".cw7", ".xml", ".out", ".lst", ".txt", ".html", ".htm")
+AME_FILE_EXTS      = (".mdl", ".xmt_txt", ".amz", ".txt", ".html", ".htm")
+def _sql_in(exts) -> str:
+    return "(" + ",".join(f"'{e}'" for e in exts) + ")"
+IS_COMPRESS_SQL = f"((detector_bits & 4) != 0 OR ext IN {_sql_in(COMPRESS_FILE_EXTS)})"
+IS_AME_SQL      = f"((detector_bits & 8) != 0 OR ext IN {_sql_in(AME_FILE_EXTS)})"
+
 def load_detectors(cfg: dict) -> Dict[str, dict]:
     det = {k: {kk: set(vv) if isinstance(vv,(list,set,tuple)) else vv for kk,vv in v.items()} for k,v in DEFAULT_DETECTORS.items()}
     for key, spec in (cfg.get("detectors") or {}).items():
         d = det.setdefault(key, {})
         if "ext_any" in spec: d["ext_any"] = set(spec["ext_any"])
         if "name_tokens_any" in spec: d["name_tokens_any"] = set(t.lower() for t in spec["name_tokens_any"])
-    return det
+    # labels end up in every detector_hits string; intern them once
+    return {sys.intern(k): v for k, v in det.items()}
 
 # ================= data model =================
-@dataclass
-class FileRow:
-    file_hash16: str
-    job_id: str
-    rel_path: str
-    ext: str
-    size_bytes: int
-    mtime_utc: str
-    kind: str
-    tokens_fname: str
-    detector_hits: str
-    deleted: int = 0
-    q_version: Optional[int] = None
+# A files row is a plain tuple in upsert_files column order:
+#   (file_hash16, job_id, rel_path, ext, size_bytes, mtime_utc,
+#    kind, tokens_fname, detector_hits, deleted, q_version, detector_bits, is_compress, is_ame,
+#    mtime_ns)
+FileRow = Tuple[str, str, str, str, int, str, str, str, str, int, Optional[int], int, int, int, int]
 
 JOB_ID_PAT: Optional[re.Pattern] = None
 
-def parse_job_id_from_path(path: Path, job_re: re.Pattern) -> Optional[str]:
-    for p in [path, *path.parents]:
-        m = job_re.search(str(p))
-        if m: return m.group("job")
-    return None
+def parse_job_id_from_path(path: str | Path, job_re: re.Pattern) -> Optional[str]:
+    # every parent is a prefix of the full path, so one search over it finds the same id
+    m = job_re.search(str(path))
+    return m.group("job") if m else None
+
+def job_root_from_match(path: str, m: re.Match) -> str:
+    # the job folder is the path component holding the match: cut at the next separator
+    end = path.find(os.sep, m.end())
+    return path if end < 0 else path[:end]
 
 def job_year_from_job_id(job_id: str) -> Optional[int]:
     try:
@@ -258,97 +515,266 @@ def job_year_from_job_id(job_id: str) -> Optional[int]:
     except Exception:
         return None
 
+_EXT_KIND = {
+    ".pdf": "pdf",
+    **dict.fromkeys((".dwg",".dxf"), "cad"),
+    **dict.fromkeys((".jpg",".jpeg",".png",".bmp",".tif",".tiff",".heic"), "image"),
+    **dict.fromkeys((".txt",".csv",".log",".md",".xml",".html",".htm"), "text"),
+}
 def detect_kind(ext: str) -> str:
-    e = ext.lower()
-    if e == ".pdf": return "pdf"
-    if e in {".dwg",".dxf"}: return "cad"
-    if e in {".jpg",".jpeg",".png",".bmp",".tif",".tiff",".heic"}: return "image"
-    if e in {".txt",".csv",".log",".md",".xml",".html",".htm"}: return "text"
-    return "other"
-
-def apply_detectors(tokens: List[str], ext: str, detectors: Dict[str,dict]) -> List[str]:
-    hits = []; tokset = set(tokens); e = ext.lower()
-    for label, spec in detectors.items():
-        ext_any = spec.get("ext_any") or set()
-        nt_any  = spec.get("name_tokens_any") or set()
-        if (ext_any and e in ext_any) or (nt_any and (tokset & nt_any)):
-            hits.append(label)
-    return hits
+    return _EXT_KIND.get(ext.lower(), "other")
+
+# Detectors compiled to lookups: ext -> label mask and name token -> label mask, so a file
+# costs one dict probe per token instead of a set test per detector. Bit i of a mask is
+# labels[i]; hits keep the detector order of the config.
+DetectorIndex = Tuple[Tuple[str, ...], Dict[str, int], Dict[str, int]]
+
+def compile_detectors(detectors: Dict[str,dict]) -> DetectorIndex:
+    labels = tuple(detectors); by_ext: Dict[str, int] = {}; by_tok: Dict[str, int] = {}
+    for i, label in enumerate(labels):
+        spec = detectors[label]
+        for e in spec.get("ext_any") or ():
+            by_ext[e] = by_ext.get(e, 0) | (1 << i)
+        for t in spec.get("name_tokens_any") or ():
+            by_tok[t] = by_tok.get(t, 0) | (1 << i)
+    return labels, by_ext, by_tok
+
+def apply_detectors(tokens: List[str], ext: str, index: DetectorIndex) -> List[str]:
+    labels, by_ext, by_tok = index
+    mask = by_ext.get(ext.lower(), 0)
+    for t in tokens:
+        mask |= by_tok.get(t, 0)
+    if not mask:
+        return []
+    return [label for i, label in enumerate(labels) if mask >> i & 1]
+
+# walk_files yields a directory's files together, so remembering the last parent's tokens
+# tokenizes each directory path once instead of once per sibling
+_PARENT_TOKENS: list = [None, ()]  # [parent, tokens]
+
+def fname_tokens(name: str, parent: str) -> List[str]:
+    if _PARENT_TOKENS[0] != parent:
+        _PARENT_TOKENS[0], _PARENT_TOKENS[1] = parent, tuple(norm_tokens(parent))
+    toks = norm_tokens(name)
+    toks.extend(_PARENT_TOKENS[1])
+    return toks
+
+def classify(name: str, parent: str, ext: str, detectors: DetectorIndex) -> Tuple[str, str, str, int, int, int]:
+    """Everything a files row derives from the path:
+    (tokens_fname, detector_hits, kind, detector_bits, is_compress, is_ame)."""
+    tokens = fname_tokens(name, parent)
+    hits = apply_detectors(tokens, ext, detectors)
+    bits = 0
+    for label in hits:
+        bits |= DETECTOR_BITS.get(label, 0)
+    is_compress = int(bool(bits & 4) or ext in COMPRESS_FILE_EXTS)
+    is_ame      = int(bool(bits & 8) or ext in AME_FILE_EXTS)
+    return " ".join(tokens[:64]), ",".join(hits), detect_kind(ext), bits, is_compress, is_ame
 
 # ================= QUOTES helpers =================
-def parse_quote_context(path: Path, quotes_roots: List[str], year_min: int, year_max: int):
+def quote_root_prefixes(quotes_roots: List[str]) -> List[str]:
+    # walk_files builds every path from Path(root), so match that same spelling: lowercased,
+    # with a trailing separator. No resolve(): it is a syscall (and may turn P:\ into UNC).
+    return [os.path.join(str(Path(r)), "").lower() for r in quotes_roots]
+
+def quote_year_of(path: str | Path, q_roots: List[str], year_min: int, year_max: int) -> Optional[int]:
     r"""
-    If path is under QUOTES\YYYY\... and name or a parent contains Q####(.N),
-    return (job_id, job_year, job_root, q_version). Else None.
+    If path is under QUOTES\YYYY\... with YYYY inside [year_min, year_max], return YYYY. Else None.
+    q_roots comes from quote_root_prefixes().
     """
-    try:
-        rp = path.resolve()
-    except Exception:
-        rp = path
-
-    for root in quotes_roots:
-        try:
-            rel = rp.relative_to(Path(root).resolve())
-        except Exception:
-            continue
-
-        parts = rel.parts
-        if not parts:
+    path = os.fspath(path)
+    plow = path.lower()
+    for root in q_roots:
+        if not plow.startswith(root):
             continue
-        y = parts[0]
+        y = path[len(root):].split(os.sep, 1)[0]
         if not YEAR_DIR_RE.fullmatch(y):
             continue
         yint = int(y)
         if not (year_min <= yint <= year_max):
             continue
+        return yint
 
-        # Q####(.N) in parent chain or filename
-        q_folder = None
-        for pr in [path.parent, *path.parents]:
-            if QNUM_RE.search(pr.name):
-                q_folder = pr
-                break
-        m = QNUM_RE.search((q_folder.name if q_folder else path.stem))
-        if not m:
-            continue
+    return None
 
-        num = m.group("num")
-        ver = m.group("ver")
-        qver = int(ver) if ver else 0
+def find_q_folder(path: str) -> Optional[str]:
+    # nearest of path itself or its parents whose name carries Q####(.N): the last match
+    # in one scan of the whole string, cut at the end of its component
+    m = None
+    for m in QNUM_RE.finditer(path):
+        pass
+    return job_root_from_match(path, m) if m else None
 
-        job_id  = f"Q{num}-{yint % 100:02d}"
-        job_root = q_folder or path.parent
-        return job_id, yint, job_root, qver
+def quote_job_from_match(m: re.Match, yint: int) -> Tuple[str, int]:
+    ver = m.group("ver")
+    return f"Q{m.group('num')}-{yint % 100:02d}", (int(ver) if ver else 0)
 
+def parse_quote_context(path: str | Path, q_roots: List[str], year_min: int, year_max: int):
+    r"""
+    If path is under QUOTES\YYYY\... and name or a parent contains Q####(.N),
+    return (job_id, job_year, job_root, q_version). Else None.
+    """
+    path = os.fspath(path)
+    yint = quote_year_of(path, q_roots, year_min, year_max)
+    if yint is None:
+        return None
+
+    # Q####(.N) in parent chain or filename
+    parent = os.path.dirname(path)
+    q_folder = find_q_folder(parent)
+    m = QNUM_RE.search(os.path.basename(q_folder) if q_folder else os.path.splitext(os.path.basename(path))[0])
+    if not m:
+        return None
+
+    job_id, qver = quote_job_from_match(m, yint)
+    job_root = q_folder or parent
+    return job_id, yint, job_root, qver
+
+# ================= job resolution (memoized per directory) =================
+# Siblings share every parent-chain regex result, so resolve once per directory.
+# Key: parent directory string. Value: (dir_job, dir_quote, quote_year)
+#   dir_job    -> (job_id, job_root, None, None) when the directory path carries a job id
+#   dir_quote  -> (job_id, job_root, job_year, q_version) when a Q#### folder is in the chain
+#   quote_year -> QUOTES year of the directory, so a Q#### *file name* can still decide
+_PARENT_JOBID_CACHE: "OrderedDict[str, tuple]" = OrderedDict()
+_PARENT_JOBID_CACHE_MAX = 65536
+
+def _dir_job_context(parent: str, q_roots: List[str], year_min: int, year_max: int) -> tuple:
+    m = JOB_ID_PAT.search(parent)
+    if m:
+        return (m.group("job"), job_root_from_match(parent, m), None, None), None, None
+    yint = quote_year_of(parent, q_roots, year_min, year_max)
+    if yint is None:
+        return None, None, None
+    q_folder = find_q_folder(parent)
+    if q_folder is None:
+        return None, None, yint
+    job_id, qver = quote_job_from_match(QNUM_RE.search(os.path.basename(q_folder)), yint)
+    return None, (job_id, q_folder, yint, qver), yint
+
+def resolve_job_context(parent: str, name: str, q_roots: List[str], year_min: int, year_max: int):
+    """
+    (job_id, job_root, job_year, q_version) for file `name` in directory `parent`,
+    or None if it belongs to no job. JOBS ids (directory or file name) win over the
+    QUOTES fallback. job_root is a path string.
+    """
+    ctx = _PARENT_JOBID_CACHE.get(parent)
+    if ctx is None:
+        ctx = _dir_job_context(parent, q_roots, year_min, year_max)
+        _PARENT_JOBID_CACHE[parent] = ctx
+        if len(_PARENT_JOBID_CACHE) > _PARENT_JOBID_CACHE_MAX:
+            _PARENT_JOBID_CACHE.popitem(last=False)
+    else:
+        _PARENT_JOBID_CACHE.move_to_end(parent)
+
+    dir_job, dir_quote, quote_year = ctx
+    if dir_job:
+        return dir_job
+    m = JOB_ID_PAT.search(name)
+    if m:
+        return m.group("job"), parent, None, None
+    if dir_quote:
+        return dir_quote
+    if quote_year is not None:
+        m = QNUM_RE.search(os.path.splitext(name)[0])
+        if m:
+            job_id, qver = quote_job_from_match(m, quote_year)
+            return job_id, parent, quote_year, qver
     return None
 
-def should_parse_pdf_jobs(path: Path, cfg: dict) -> bool:
-    pdf_cfg = (cfg.get("pdf_text") or {})
-    if not pdf_cfg.get("enabled") or fitz is None: return False
-    if path.suffix.lower() != ".pdf": return False
-    allow = set(x.lower() for x in pdf_cfg.get("path_allow_tokens", []))
-    if not allow: return True
-    return any(tok in str(path.parent).lower() for tok in allow)
-
-def should_parse_pdf_quotes_only(path: Path, quotes_roots: List[str], year_min: int, year_max: int) -> bool:
-    if path.suffix.lower() != ".pdf": return False
-    # Only PDFs with Q####(.N) in folder or filename and under a valid year
-    qc = parse_quote_context(path, quotes_roots, year_min, year_max)
-    return qc is not None
-
-def extract_pdf_text(path: Path, max_pages=10, max_chars=40000) -> str:
+def is_quote_pdf(ext: str, job_id: str, qver: Optional[int]) -> bool:
+    # Only PDFs with Q####(.N) in folder or filename and under a valid year. That is
+    # exactly when resolve_job_context took the QUOTES branch (qver set), so reuse its
+    # per-directory result instead of resolving the path again.
+    return ext == ".pdf" and qver is not None and job_id.startswith("Q")
+
+def wants_pdf_text(plow: str, ext: str, job_id: str, qver: Optional[int],
+                   jobs_pdf: bool, allow_re: Optional[re.Pattern]) -> bool:
+    """
+    Should this file's PDF text go into FTS? plow/ext are the lowercased path/extension.
+    JOBS PDFs need pdf_text.enabled (jobs_pdf) and, when allow_re is set (compiled
+    pdf_text.path_allow_tokens), a token in the parent directory; quotes use is_quote_pdf.
+    """
+    if ext != ".pdf": return False  # most files stop here
+    if job_id.startswith("Q"): return is_quote_pdf(ext, job_id, qver)
+    if not jobs_pdf: return False
+    # search the parent part in place (endpos) instead of slicing a lowered dirname copy
+    return allow_re is None or allow_re.search(plow, 0, plow.rfind(os.sep)) is not None
+
+def fts_join(*parts: str) -> str:
+    return " ".join(p for p in parts if p)
+
+def extract_file_text(path: str, size: int, max_pages: int, max_chars: int, max_bytes: int,
+                      office_cfg: dict) -> str:
+    # phase-2 unit of work (top level, so a worker process can run it): PDF or parsed Office text
+    if path.lower().endswith(".pdf"):
+        return extract_pdf_text(path, max_pages, max_chars, max_bytes, size)
+    return extract_office_text(path, office_cfg)
+
+def iter_file_texts(todo: list, max_pages: int, max_chars: int, max_bytes: int,
+                    office_cfg: dict, workers: int) -> Iterator[Tuple[tuple, str]]:
+    """
+    Yield (item, text) for each (fh, path, size, ...) item, in completion order.
+    Runs extract_file_text in a process pool (at most 2 x workers in flight);
+    workers <= 1 extracts inline.
+    """
+    if workers <= 1:
+        for item in todo:
+            yield item, extract_file_text(item[1], item[2], max_pages, max_chars, max_bytes, office_cfg)
+        return
+    items = iter(todo)
+    pending: Dict[Future, tuple] = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            for item in items:  # top up to the in-flight cap
+                fut = pool.submit(extract_file_text, item[1], item[2], max_pages, max_chars, max_bytes, office_cfg)
+                pending[fut] = item
+                if len(pending) >= 2 * workers: break
+            if not pending: return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                try: txt = fut.result()
+                except Exception: txt = ""
+                yield pending.pop(fut), txt
+
+# A page whose content streams exceed this many (compressed) bytes, right after a page that
+# gave almost no text, is taken for a vector drawing: parsing it yields little but costs most.
+GRAPHICS_PAGE_BYTES = 1 << 20
+GRAPHICS_PREV_CHARS = 200
+
+def extract_pdf_text(path: str | Path, max_pages=10, max_chars=40000,
+                     max_bytes=10 * 1024 * 1024, size: Optional[int] = None,
+                     skip_graphics_pages: bool = True) -> str:
     if fitz is None: return ""
     try:
-        doc = fitz.open(str(path))
-        pages = min(max_pages, len(doc))
-        chunks = []
-        for i in range(pages):
-            chunks.append(doc[i].get_text("text"))
-        doc.close()
-        txt = " ".join(" ".join(chunks).split())
-        return txt[:max_chars]
+        # Over SMB every MuPDF seek is a round-trip; read small/normal PDFs in one
+        # sequential read. Bigger ones open by path (a truncated file loses its xref).
+        if size is None: size = os.path.getsize(path)
+        if size <= max_bytes:
+            with open(path, "rb") as fh:
+                doc = fitz.open(stream=fh.read(), filetype="pdf")
+        else:
+            doc = fitz.open(str(path))
     except Exception:
         return ""
+    # no whitespace reflow: the unicode61 tokenizer splits on it anyway
+    try:
+        chunks, total, prev_len = [], 0, None
+        for i in range(min(max_pages, doc.page_count)):
+            page = doc.load_page(i)
+            if (skip_graphics_pages and prev_len is not None and prev_len < GRAPHICS_PREV_CHARS
+                    and sum(len(doc.xref_stream_raw(x) or b"") for x in page.get_contents()) > GRAPHICS_PAGE_BYTES):
+                continue
+            # text only (no image blocks); the TextPage is dropped as soon as it is read
+            t = page.get_textpage(flags=fitz.TEXTFLAGS_TEXT).extractText().strip()
+            prev_len = len(t)
+            chunks.append(t); total += len(t) + 1
+            if total >= max_chars: break
+        return " ".join(chunks)[:max_chars]
+    except Exception:
+        return ""
+    finally:
+        doc.close()
 
 # ---- office helpers (optional) ----
 def read_text_file_safe(path: Path, max_chars: int = 40000) -> str:
@@ -371,7 +797,33 @@ def extract_csv_text(path: Path, max_lines: int = 200, max_chars: int = 40000) -
     except Exception:
         return ""
 
+def extract_xlsx_text_calamine(path: Path, sheet_limit=3, cell_limit=500, max_chars=40000) -> str:
+    try:
+        wb = CalamineWorkbook.from_path(os.fspath(path))
+    except Exception:
+        return ""
+    try:
+        chunks = []
+        for name in wb.sheet_names[:sheet_limit]:
+            count = 0
+            for row in wb.get_sheet_by_name(name).iter_rows():
+                for v in row:
+                    if v is None or v == "": continue
+                    # numbers come back as floats; 12.0 -> "12" like openpyxl's int cells
+                    if isinstance(v, float) and v.is_integer(): v = int(v)
+                    chunks.append(str(v)); count += 1
+                    if count >= cell_limit: break
+                if count >= cell_limit: break
+        return " ".join(chunks)[:max_chars]
+    except Exception:
+        return ""
+    finally:
+        close = getattr(wb, "close", None)  # older python-calamine releases have no close()
+        if close: close()
+
 def extract_xlsx_text(path: Path, sheet_limit=3, cell_limit=500, max_chars=40000) -> str:
+    if CalamineWorkbook is not None:
+        return extract_xlsx_text_calamine(path, sheet_limit, cell_limit, max_chars)
     if openpyxl is None: return ""
     try:
         wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
@@ -416,15 +868,27 @@ def extract_pptx_text(path: Path, max_chars=40000) -> str:
     except Exception:
         return ""
 
-def extract_office_text(path: Path, cfg: dict) -> str:
+# workbook extensions office_text "xlsx" covers; legacy .xls/.xlsb need python-calamine
+XLSX_EXTS = (".xlsx", ".xlsm") + ((".xls", ".xlsb") if CalamineWorkbook is not None else ())
+
+def office_parsed_exts(cfg: dict) -> frozenset:
+    """Extensions extract_office_text parses as Office containers under this config: the
+    CPU-heavy ones, extracted in the phase-2 process pool. Plain text/CSV reads stay inline."""
+    oc = (cfg.get("office_text") or {})
+    if not oc.get("enabled"): return frozenset()
+    include = set(x.lower() for x in oc.get("include", []))
+    exts = {"xlsx": XLSX_EXTS, "docx": (".docx",), "pptx": (".pptx",)}
+    return frozenset(e for key, es in exts.items() if key in include for e in es)
+
+def extract_office_text(path: str | Path, cfg: dict) -> str:
     oc = (cfg.get("office_text") or {})
     if not oc.get("enabled"): return ""
     include = set(x.lower() for x in oc.get("include", []))
     max_chars = int(oc.get("max_chars", 40000))
-    ext = path.suffix.lower()
+    ext = os.path.splitext(os.fspath(path))[1].lower()
     if ext == ".csv" and "csv" in include:
         return extract_csv_text(path, max_lines=int(oc.get("csv_max_lines",200)), max_chars=max_chars)
-    if ext in (".xlsx",".xlsm") and "xlsx" in include:
+    if ext in XLSX_EXTS and "xlsx" in include:
         return extract_xlsx_text(path, sheet_limit=int(oc.get("xlsx_sheet_limit",3)),
                                  cell_limit=int(oc.get("xlsx_cells_limit",500)),
                                  max_chars=max_chars)
@@ -437,17 +901,36 @@ def extract_office_text(path: Path, cfg: dict) -> str:
     return ""
 
 # ================= scanning =================
-def walk_files(roots: List[str], scan_policy: dict, denylist_paths: List[str]) -> Iterator[Path]:
-    deny = [p.lower().rstrip("\\/") for p in (denylist_paths or [])]
+_SKIP_DIR_NAMES = frozenset({"$recycle.bin", "system volume information"})
+
+def walk_files(roots: List[str], scan_policy: dict, denylist_paths: List[str],
+               ignore_dir_re: Optional[re.Pattern] = None,
+               counters: Optional[Dict[str, int]] = None) -> Iterator[os.DirEntry]:
+    """
+    Yield the os.DirEntry of every file. Callers use entry.path / entry.name (plain str)
+    and entry.stat(): on Windows the FindNextFile data is already cached, elsewhere it is
+    one lstat without re-walking the path.
+
+    Directories whose (lowercased) path matches ignore_dir_re are not descended into;
+    a match in a directory path is a match for everything below it. Each pruned
+    directory counts once in counters["skipped_ignored_dir"].
+
+    scan_policy.workers (default 8) directories are listed concurrently: on a share each
+    listing is mostly network round-trips, which threads overlap. 1 walks serially.
+    Files then come out in completion order rather than directory order.
+    """
+    deny = tuple(p.lower().rstrip("\\/") for p in (denylist_paths or []))
     year_only = bool((scan_policy or {}).get("only_year_dirs_under_roots", False))
     year_re   = re.compile((scan_policy or {}).get("year_dir_regex", r"^\d{4}$"), re.I)
     year_min  = int((scan_policy or {}).get("year_min", 1900))
     year_max  = int((scan_policy or {}).get("year_max", 2100))
+    workers   = int((scan_policy or {}).get("workers", 8))
 
-    def denied(path: Path) -> bool:
-        plow = str(path).lower(); return any(plow.startswith(p) for p in deny)
+    def denied(plow: str) -> bool:
+        # plow is the already-lowercased path; str.startswith(tuple) tests every prefix in C
+        return bool(deny) and plow.startswith(deny)
 
-    def push_children_year_dirs(rootp: Path, stack: List[Path]) -> None:
+    def push_children_year_dirs(rootp: Path, stack: List[str]) -> None:
         try:
             with os.scandir(rootp) as it:
                 for e in it:
@@ -457,12 +940,11 @@ def walk_files(roots: List[str], scan_policy: dict, denylist_paths: List[str]) -
                     try: yr = int(re.findall(r"\d{4}", name)[0])
                     except Exception: continue
                     if yr < year_min or yr > year_max: continue
-                    p = Path(e.path)
-                    if not denied(p): stack.append(p)
+                    if not denied(e.path.lower()): stack.append(e.path)
         except (PermissionError, FileNotFoundError, OSError):
             return
 
-    def scandir_safe(d: Path):
+    def scandir_safe(d: str):
         for attempt in (0,1):
             try: return os.scandir(d)
             except (FileNotFoundError, OSError):
@@ -470,31 +952,62 @@ def walk_files(roots: List[str], scan_policy: dict, denylist_paths: List[str]) -
                 return None
             except PermissionError: return None
 
+    def list_dir(d: str) -> Tuple[List[str], List[os.DirEntry]]:
+        # (subdirectories to descend, file entries) of one directory; safe on a pool thread
+        subdirs: List[str] = []; files: List[os.DirEntry] = []
+        it = scandir_safe(d)
+        if it is None: return subdirs, files
+        try:
+            with it:
+                for e in it:
+                    try:
+                        if e.is_dir(follow_symlinks=False):
+                            if e.name.lower() in _SKIP_DIR_NAMES: continue
+                            if not denied(e.path.lower()): subdirs.append(e.path)
+                        elif e.is_file(follow_symlinks=False):
+                            files.append(e)
+                    except (PermissionError, FileNotFoundError, OSError):
+                        continue
+        except (PermissionError, FileNotFoundError, OSError):
+            pass
+        return subdirs, files
+
+    def pruned(d: str) -> bool:
+        if ignore_dir_re is not None and ignore_dir_re.search(d.lower()):
+            if counters is not None: counters["skipped_ignored_dir"] += 1
+            return True
+        return False
+
+    stack: List[str] = []
     for root in roots:
         rootp = Path(root)
-        if not rootp.exists() or denied(rootp): continue
-        stack: List[Path] = []
+        if not rootp.exists() or denied(str(rootp).lower()): continue
         if year_only: push_children_year_dirs(rootp, stack)
-        else: stack.append(rootp)
+        else: stack.append(str(rootp))
+
+    if workers <= 1:
         while stack:
             d = stack.pop()
-            it = scandir_safe(d)
-            if it is None: continue
-            try:
-                with it:
-                    for e in it:
-                        try:
-                            if e.is_dir(follow_symlinks=False):
-                                name = e.name.lower()
-                                if name in {"$recycle.bin","system volume information"}: continue
-                                p = Path(e.path)
-                                if not denied(p): stack.append(p)
-                            elif e.is_file(follow_symlinks=False):
-                                yield Path(e.path)
-                        except (PermissionError, FileNotFoundError, OSError):
-                            continue
-            except (PermissionError, FileNotFoundError, OSError):
-                continue
+            if pruned(d): continue
+            subdirs, files = list_dir(d)
+            stack.extend(subdirs)
+            yield from files
+        return
+
+    # depth-first backlog, at most 2 x workers listings in flight
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan") as pool:
+        pending: set = set()
+        while stack or pending:
+            while stack and len(pending) < 2 * workers:
+                d = stack.pop()
+                if not pruned(d):
+                    pending.add(pool.submit(list_dir, d))
+            if not pending: continue
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                subdirs, files = fut.result()
+                stack.extend(subdirs)
+                yield from files
 
 # ================= db ops =================
 def ensure_job(con: sqlite3.Connection, job_id: str, root_path: str, job_year: Optional[int]) -> None:
@@ -511,64 +1024,116 @@ def ensure_job(con: sqlite3.Connection, job_id: str, root_path: str, job_year: O
 def upsert_files(con: sqlite3.Connection, rows: List[FileRow]) -> None:
     con.executemany("""
       INSERT INTO files (file_hash16, job_id, rel_path, ext, size_bytes, mtime_utc,
-                         kind, tokens_fname, detector_hits, deleted, q_version)
-      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                         kind, tokens_fname, detector_hits, deleted, q_version, detector_bits,
+                         is_compress, is_ame, mtime_ns)
+      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
       ON CONFLICT(file_hash16) DO UPDATE SET
+        rel_path=excluded.rel_path,
         size_bytes=excluded.size_bytes,
         mtime_utc=excluded.mtime_utc,
+        mtime_ns=excluded.mtime_ns,
         kind=excluded.kind,
         tokens_fname=excluded.tokens_fname,
         detector_hits=excluded.detector_hits,
+        detector_bits=excluded.detector_bits,
+        is_compress=excluded.is_compress,
+        is_ame=excluded.is_ame,
         deleted=0,
         q_version=COALESCE(excluded.q_version, files.q_version)
-    """, [(r.file_hash16, r.job_id, r.rel_path, r.ext, r.size_bytes, r.mtime_utc,
-           r.kind, r.tokens_fname, r.detector_hits, r.deleted, r.q_version)
-          for r in rows])
+    """, rows)
 
 def upsert_fts_rows(con: sqlite3.Connection, fts_rows: List[Tuple[str,str]]) -> None:
+    # the file_text triggers replace the fts_files entry; unchanged text (a re-saved
+    # file whose name tokens/body are the same) skips the FTS delete+insert entirely
+    # file_text.id is files.id, so the files row must already be written (same or earlier
+    # transaction); rows without one are skipped silently, so callers flush files first
     if not fts_rows: return
-    for content, fh in fts_rows:
-        con.execute("DELETE FROM fts_files WHERE file_hash16=?", (fh,))
-        con.execute("INSERT INTO fts_files(content, file_hash16) VALUES (?,?)", (content, fh))
-
-def mark_deleted_missing(con: sqlite3.Connection, seen_hashes: set, year_min: Optional[int], year_max: Optional[int]) -> int:
+    con.executemany("""
+      INSERT INTO file_text(id, content, file_hash16)
+      SELECT id, ?, file_hash16 FROM files WHERE file_hash16=?
+      ON CONFLICT(file_hash16) DO UPDATE SET content=excluded.content
+      WHERE file_text.content IS NOT excluded.content
+    """, fts_rows)
+
+def drop_file_text(con: sqlite3.Connection, rows: List[Tuple[str]]) -> None:
+    # (fh,) of files whose new text is still to be extracted; the triggers drop their FTS entries
+    if not rows: return
+    con.executemany("DELETE FROM file_text WHERE file_hash16=?", rows)
+
+# In-memory sets/dicts over millions of files key on the 64-bit value of file_hash16:
+# a small int is ~half the size of the 16-char str and hashes without touching chars.
+def hash_key(fh: str) -> int:
+    return int(fh, 16)
+
+def load_fts_hashes(con: sqlite3.Connection) -> set:
+    # one sequential read up front instead of a per-file "is it in FTS?" probe
+    return {hash_key(fh) for (fh,) in con.execute("SELECT file_hash16 FROM file_text")}
+
+def fill_mtime_ns(con: sqlite3.Connection, rows: List[Tuple[int, str]]) -> None:
+    # (mtime_ns, file_hash16) for unchanged rows written before files.mtime_ns existed
+    con.executemany("UPDATE files SET mtime_ns=? WHERE file_hash16=?", rows)
+
+def load_known_files(con: sqlite3.Connection, year_lo: int, year_hi: int) -> Dict[int, Tuple[int, Optional[int], str, str]]:
+    # live rows of jobs in the scan window -> (size_bytes, mtime_ns, mtime_utc, rel_path); read once, probed in memory
+    return {hash_key(fh): (sz, ns, mt, rel) for fh, sz, ns, mt, rel in con.execute("""
+      SELECT f.file_hash16, f.size_bytes, f.mtime_ns, f.mtime_utc, f.rel_path
+      FROM files f JOIN jobs j ON j.job_id=f.job_id
+      WHERE f.deleted=0 AND j.job_year BETWEEN ? AND ?
+    """, (year_lo, year_hi))}
+
+def mark_deleted_missing(con: sqlite3.Connection, seen_hashes: set, year_min: Optional[int], year_max: Optional[int]) -> Tuple[int, set]:
+    """Soft-delete live rows not seen this scan; returns (count, job_ids that lost files)."""
     if year_min is not None and year_max is not None:
         cur = con.execute("""
-          SELECT f.file_hash16
+          SELECT f.file_hash16, f.job_id
           FROM files f JOIN jobs j ON j.job_id=f.job_id
           WHERE f.deleted=0 AND j.job_year BETWEEN ? AND ?
         """, (year_min, year_max))
     else:
-        cur = con.execute("SELECT file_hash16 FROM files WHERE deleted=0")
-    to_delete = [(fh,) for (fh,) in cur.fetchall() if fh not in seen_hashes]
+        cur = con.execute("SELECT file_hash16, job_id FROM files WHERE deleted=0")
+    # seen_hashes holds hash_key() ints
+    to_delete, jobs = [], set()
+    for fh, job_id in cur:
+        if hash_key(fh) not in seen_hashes:
+            to_delete.append((fh,)); jobs.add(job_id)
     if to_delete:
         con.executemany("UPDATE files SET deleted=1 WHERE file_hash16=?", to_delete)
-    return len(to_delete)
-
-def rollup_job_stats(con: sqlite3.Connection, job_id: str) -> None:
-    fc, bytes_, maxmt = con.execute(
-        "SELECT COUNT(*), COALESCE(SUM(size_bytes),0), MAX(mtime_utc) FROM files WHERE job_id=? AND deleted=0",
-        (job_id,)
-    ).fetchone()
-    def exists(sql): return con.execute(sql, (job_id,)).fetchone()[0]
-    has_pdf      = exists("SELECT EXISTS(SELECT 1 FROM files WHERE job_id=? AND deleted=0 AND (ext='.pdf' OR instr(detector_hits,'pdf')>0))")
-    has_cad      = exists("SELECT EXISTS(SELECT 1 FROM files WHERE job_id=? AND deleted=0 AND (ext IN('.dwg','.dxf') OR instr(detector_hits,'cad')>0))")
-    has_compress = exists("SELECT EXISTS(SELECT 1 FROM files WHERE job_id=? AND deleted=0 AND instr(detector_hits,'compress')>0)")
-    has_ame      = exists("SELECT EXISTS(SELECT 1 FROM files WHERE job_id=? AND deleted=0 AND instr(detector_hits,'ametank')>0)")
+    return len(to_delete), jobs
+
+def rollup_job_stats(con: sqlite3.Connection, job_ids: Iterable[str]) -> None:
+    """Recompute jobs totals/has_* flags and job_file_stats for job_ids in one grouped pass."""
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS rollup_jobs (job_id TEXT PRIMARY KEY)")
+    con.execute("DELETE FROM rollup_jobs")
+    con.executemany("INSERT OR IGNORE INTO rollup_jobs(job_id) VALUES (?)", ((j,) for j in job_ids))
+    # LEFT JOIN so a job whose files are all gone rolls up to zeros; MAX() over a boolean acts as EXISTS
+    rows = con.execute(f"""
+      SELECT r.job_id, COUNT(f.file_hash16), COALESCE(SUM(size_bytes),0), MAX(mtime_utc),
+             COALESCE(MAX(ext='.pdf' OR (detector_bits & 1) != 0), 0),
+             COALESCE(MAX(ext IN ('.dwg','.dxf') OR (detector_bits & 2) != 0), 0),
+             COALESCE(MAX((detector_bits & 4) != 0), 0),
+             COALESCE(MAX((detector_bits & 8) != 0), 0),
+             COALESCE(MAX((detector_bits & 16) != 0), 0),
+             {JOB_FILE_COUNTS_SQL}
+      FROM rollup_jobs r LEFT JOIN files f ON f.job_id=r.job_id AND f.deleted=0
+      GROUP BY r.job_id
+    """).fetchall()
+    con.executemany("""INSERT OR REPLACE INTO job_file_stats (job_id, n_pdf, n_cad, n_compress, n_ame)
+                       VALUES (?, ?, ?, ?, ?)""", [(r[0],) + tuple(r[9:]) for r in rows])
+    # (fc, bytes, maxmt, has_pdf, has_cad, has_compress, has_ame, has_legacy, job_id)
+    upd = [tuple(r[1:9]) + (r[0],) for r in rows]
     try:
-        has_legacy = exists("SELECT EXISTS(SELECT 1 FROM files WHERE job_id=? AND deleted=0 AND instr(detector_hits,'legacy_calc')>0)")
-        con.execute("""UPDATE jobs SET
-          file_count_total=?, byte_size_total=?, has_pdf=?, has_dwg_dxf=?, has_compress=?, has_ame=?, has_legacy_calc=?, last_modified_utc=?
-          WHERE job_id=?""", (fc, bytes_, has_pdf, has_cad, has_compress, has_ame, has_legacy, maxmt, job_id))
+        con.executemany("""UPDATE jobs SET
+          file_count_total=?, byte_size_total=?, last_modified_utc=?, has_pdf=?, has_dwg_dxf=?, has_compress=?, has_ame=?, has_legacy_calc=?
+          WHERE job_id=?""", upd)
     except sqlite3.OperationalError:
-        con.execute("""UPDATE jobs SET
-          file_count_total=?, byte_size_total=?, has_pdf=?, has_dwg_dxf=?, has_compress=?, has_ame=?, last_modified_utc=?
-          WHERE job_id=?""", (fc, bytes_, has_pdf, has_cad, has_compress, has_ame, maxmt, job_id))
+        con.executemany("""UPDATE jobs SET
+          file_count_total=?, byte_size_total=?, last_modified_utc=?, has_pdf=?, has_dwg_dxf=?, has_compress=?, has_ame=?
+          WHERE job_id=?""", [u[:7] + u[8:] for u in upd])
 
 def cleanup_old_quote_versions(con: sqlite3.Connection):
     # Keep only newest Q-PDF version per quote in FTS
     con.execute("""
-      DELETE FROM fts_files
+      DELETE FROM file_text
       WHERE file_hash16 IN (
         SELECT f.file_hash16
         FROM files f
@@ -584,6 +1149,30 @@ def cleanup_old_quote_versions(con: sqlite3.Connection):
     """)
     con.commit()
 
+# --rebuild-hashes: (old key, new key) of every file seen by the scan
+REKEY_DDL = "CREATE TEMP TABLE IF NOT EXISTS rekey (old TEXT PRIMARY KEY, new TEXT NOT NULL)"
+
+def rekey_files(con: sqlite3.Connection, algo: int) -> Tuple[int, set]:
+    """
+    Move files/file_text to the keys in the temp rekey table and record algo in user_version.
+    Keys hash the full path, which the DB doesn't keep, so rows the scan didn't see (soft-deleted,
+    or in jobs outside this run's year windows) can't be re-keyed: they are dropped, and a scan
+    over their window adds them back. Returns (rows dropped, job_ids that lost rows).
+    """
+    jobs = {r[0] for r in con.execute(
+        "SELECT DISTINCT job_id FROM files WHERE deleted=0 AND file_hash16 NOT IN (SELECT old FROM rekey)")}
+    dropped = con.execute("DELETE FROM files WHERE file_hash16 NOT IN (SELECT old FROM rekey)").rowcount
+    con.execute("DELETE FROM file_text WHERE file_hash16 NOT IN (SELECT old FROM rekey)")
+    con.execute("UPDATE files SET file_hash16 = r.new FROM rekey r WHERE files.file_hash16 = r.old")
+    # external-content FTS keeps no copy of the UNINDEXED key, so file_text is re-keyed without
+    # the update trigger re-tokenizing every document
+    drop_fts_triggers(con)
+    con.execute("UPDATE file_text SET file_hash16 = r.new FROM rekey r WHERE file_text.file_hash16 = r.old")
+    for trg in FTS_TRIGGERS:
+        con.execute(trg)
+    con.execute(f"PRAGMA user_version={algo};")
+    return dropped, jobs
+
 # ================= main =================
 def main():
     ap = argparse.ArgumentParser(description="TankFinder Indexer")
@@ -592,30 +1181,35 @@ def main():
     ap.add_argument("--no-delete", action="store_true", help="Skip delete pass (safety)")
     ap.add_argument("--year-min", type=int, default=2015, help="Min JOB year to include (via job_id)")
     ap.add_argument("--year-max", type=int, default=2100, help="Max JOB year to include (via job_id)")
-    ap.add_argument("--rebuild-fts", action="store_true", help="Drop and recreate FTS table")
+    ap.add_argument("--rebuild-fts", action="store_true", help="Drop and recreate FTS table (text is re-extracted on this scan)")
     ap.add_argument("--quotes-only", action="store_true", help="Scan only quotes_roots (skip JOBS/ARCHIVES)")
+    ap.add_argument("--rebuild-hashes", action="store_true", help="Re-key an older DB's files to the fastest hash (xxh3) on this scan (needs a complete scan)")
+    ap.add_argument("--skip-text", action="store_true", help="Skip PDF text extraction (metadata refresh; the next full run fills it in)")
     args = ap.parse_args()
 
     cfg = load_cfg()
 
     # --- DB path (env > YAML > default) ---
     db_path = resolve_db_path(cfg)          # <-- NEW
-    print(f"[indexer] DB -> {db_path}")     # helpful when running from a share
+    print(f"[indexer] DB -> {db_path}", flush=True)     # helpful when running from a share
     db_path.parent.mkdir(parents=True, exist_ok=True)
 
     # ignore config
     ignore_cfg  = (cfg.get("ignore") or {})
     ignore_exts = {e.lower() for e in ignore_cfg.get("ext", [])}
     ignore_dir_tokens = {t.lower() for t in ignore_cfg.get("dir_tokens", [])}
+    ignore_dir_re = compile_token_re(ignore_dir_tokens)
+    pdf_allow_re  = compile_token_re((cfg.get("pdf_text") or {}).get("path_allow_tokens", []))
 
     # job id regex
     global JOB_ID_PAT
     JOB_ID_PAT = re.compile(cfg.get("job_id_regex") or r"(?P<job>\b\d{3}-\d{2}\b)", re.I)
 
-    detectors     = load_detectors(cfg)
+    detectors     = compile_detectors(load_detectors(cfg))
 
     roots         = cfg.get("roots") or []
     quotes_roots  = cfg.get("quotes_roots") or []
+    quotes_roots_s = quote_root_prefixes(quotes_roots)
 
     if args.quotes_only:
         scan_roots = quotes_roots
@@ -636,14 +1230,68 @@ def main():
     # --- open DB using the resolved path ---
     con = connect_db(db_path)               # <-- CHANGED
     ensure_schema(con, rebuild_fts=args.rebuild_fts)
+    algo   = select_hash_algo(con, persist=not args.dry_run)
+    hash16 = HASH_FUNCS[algo]
+    rekey_to: Optional[int] = None
+    if args.rebuild_hashes:
+        if args.dry_run or args.limit or args.quotes_only or args.no_delete:
+            raise SystemExit("[indexer] --rebuild-hashes needs a complete scan "
+                             "(no --dry-run / --limit / --quotes-only / --no-delete)")
+        if algo != preferred_hash_algo():
+            rekey_to = preferred_hash_algo()
+            new_hash16 = HASH_FUNCS[rekey_to]
+            con.execute(REKEY_DDL); con.execute("DELETE FROM rekey")
+    rekey_batch: List[Tuple[str, str]] = []
 
     pdf_cfg = (cfg.get("pdf_text") or {})
     max_pdf_pages = int(pdf_cfg.get("max_pages", 10))
     max_pdf_chars = int(pdf_cfg.get("max_chars", 40000))
-
-    seen_hashes: set[str] = set()
+    max_pdf_bytes = int(pdf_cfg.get("max_bytes", 10 * 1024 * 1024))
+    jobs_pdf      = bool(pdf_cfg.get("enabled")) and fitz is not None
+
+    text_workers = int(pdf_cfg.get("workers", os.cpu_count() or 1))
+    office_cfg   = {"office_text": cfg.get("office_text") or {}}
+    office_pool  = office_parsed_exts(cfg)
+    # PDFs needing text and parsed Office files are extracted after the walk (phase 2):
+    # (fh, path, size, head)
+    text_todo: List[Tuple[str, str, int, str]] = []
+    # (fh,) of changed files whose old text goes with their files upsert (see queue_fts)
+    text_stale: List[Tuple[str]] = []
+
+    def queue_fts(fh: str, head: str, path_s: str, ext: str, size: int, parse_pdf: bool) -> None:
+        # no file_text row until phase 2 writes one (a changed file's old row is dropped in
+        # its files batch), so an interrupted (or, for PDFs, --skip-text) run leaves the
+        # file to the FTS backfill of the next scan
+        if parse_pdf or ext in office_pool:
+            if hash_key(fh) in fts_hashes:
+                text_stale.append((fh,))
+            if not (parse_pdf and args.skip_text):
+                text_todo.append((fh, path_s, size, head))
+            return
+        fts_batch.append((fts_join(head, extract_office_text(path_s, cfg)), fh))
+
+    def flush_batches() -> None:
+        # files before text: fts_batch mixes backfills with text of new files still in batch
+        begin_write(con); upsert_files(con, batch); drop_file_text(con, text_stale)
+        upsert_fts_rows(con, fts_batch); con.commit()
+        batch.clear(); text_stale.clear(); fts_batch.clear()
+
+    bulk_load = not args.dry_run and not con.execute("SELECT 1 FROM files LIMIT 1").fetchone()
+    if bulk_load:
+        drop_files_indexes(con)
+    # empty file_text (initial build or --rebuild-fts): load text without the FTS triggers and
+    # index it in one 'rebuild' after phase 2
+    fts_bulk = not args.dry_run and not con.execute("SELECT 1 FROM file_text LIMIT 1").fetchone()
+    if fts_bulk:
+        drop_fts_triggers(con)
+
+    seen_hashes: set[int] = set()
+    fts_hashes: set[int]  = load_fts_hashes(con)
+    known_lo, known_hi = min(args.year_min, q_year_min), max(args.year_max, q_year_max)
+    known = load_known_files(con, known_lo, known_hi)
     batch: List[FileRow]  = []
     fts_batch: List[Tuple[str, str]] = []
+    ns_fill: List[Tuple[int, str]] = []
     per_job_seen_roots: Dict[str, str] = {}
     counters = {
         "total_scanned": 0, "indexed": 0, "fts_backfilled": 0,
@@ -653,130 +1301,155 @@ def main():
 
 
     start = time.time()
-    for p in tqdm(walk_files(scan_roots, scan_policy, denylist), desc="Scanning"):
+    for entry in tqdm(walk_files(scan_roots, scan_policy, denylist, ignore_dir_re, counters), desc="Scanning"):
         counters["total_scanned"] += 1
         if args.limit and counters["total_scanned"] > args.limit:
             break
 
+        # plain strings from the DirEntry; one lower() per file, shared by every check below
+        path_s = entry.path
+        name   = entry.name
+        parent = os.path.dirname(path_s)
+        plow   = path_s.lower()
+        ext    = sys.intern(os.path.splitext(name)[1].lower())
+
         # quick cheap skips
-        if p.suffix.lower() in ignore_exts:
+        if ext in ignore_exts:
             counters["skipped_ignored_ext"] += 1; continue
-        if ignore_dir_tokens and any(tok in str(p.parent).lower() for tok in ignore_dir_tokens):
-            counters["skipped_ignored_dir"] += 1; continue
-
-        try:
-            st = p.stat()
-        except (FileNotFoundError, PermissionError, OSError):
-            continue
-        size = st.st_size
-        ext  = p.suffix.lower()
 
         # ---------- resolve job_id / job_root / jy (with QUOTES fallback) ----------
-        job_id   = parse_job_id_from_path(p, JOB_ID_PAT)
-        job_root = None
-        jy       = None
-        qver     = None
-
-        if not job_id:
-            qc = parse_quote_context(p, [str(r) for r in quotes_roots], q_year_min, q_year_max)
-            if qc:
-                job_id, jy, job_root, qver = qc
-
-        if not job_id:
+        ctx = resolve_job_context(parent, name, quotes_roots_s, q_year_min, q_year_max)
+        if ctx is None:
             counters["skipped_no_job"] += 1
             continue
+        job_id, job_root, jy, qver = ctx
+        job_id = sys.intern(job_id)
 
         # JOBS year gate (quotes use their own window)
-        if job_id and not job_id.startswith("Q"):
+        if not job_id.startswith("Q"):
             jy = jy if jy is not None else job_year_from_job_id(job_id)
             if jy is not None and ((jy < args.year_min) or (jy > args.year_max)):
                 counters["skipped_out_of_year"] += 1; continue
 
-        # Find job_root if it's a JOBS item
-        if job_root is None:
-            for parent in [p.parent, *p.parents]:
-                if JOB_ID_PAT.search(str(parent)):
-                    job_root = parent; break
-        if job_root is None:
-            # Fallback root for QUOTES already set; or skip if cannot determine
-            job_root = p.parent
+        # stat only files that belong to an in-window job (an lstat per file off Windows)
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except (FileNotFoundError, PermissionError, OSError):
+            continue
+        size = st.st_size
+        mtime_ns = st.st_mtime_ns
+        fh  = hash16(plow)
+        fk  = hash_key(fh)
+        if rekey_to is not None:
+            rekey_batch.append((fh, new_hash16(plow)))
+            if len(rekey_batch) >= BATCH_ROWS:
+                con.executemany("INSERT OR IGNORE INTO rekey VALUES (?, ?)", rekey_batch); rekey_batch.clear()
 
-        rel = str(p).replace(str(job_root) + os.sep, "", 1) if str(p).startswith(str(job_root)+os.sep) else p.name
-        fh  = file_hash16(str(p).lower())
-        mtime_iso = utc_iso(st.st_mtime)
+        root_prefix = job_root + os.sep
+        rel = path_s[len(root_prefix):] if path_s.startswith(root_prefix) else name
 
         # unchanged fast-path (+ FTS backfill if needed)
-        row = con.execute("SELECT size_bytes, mtime_utc FROM files WHERE file_hash16=?", (fh,)).fetchone()
+        rel_only = False
+        row = known.get(fk)
+        if row is None and not (jy is not None and known_lo <= jy <= known_hi):
+            # job outside the prefetched window (or undated): ask SQLite directly
+            row = con.execute("SELECT size_bytes, mtime_ns, mtime_utc, rel_path FROM files WHERE file_hash16=? AND deleted=0", (fh,)).fetchone()
         if row:
-            old_size, old_mtime = row
-            if int(old_size) == int(size) and old_mtime == mtime_iso:
+            old_size, old_ns, old_mtime, old_rel = row
+            # two int compares; rows from before mtime_ns match on the ISO string once, then get it
+            if int(old_size) == size and (old_ns == mtime_ns if old_ns is not None
+                                          else old_mtime == utc_iso(st.st_mtime)):
                 if not args.dry_run:
-                    has_fts = con.execute("SELECT 1 FROM fts_files WHERE file_hash16=? LIMIT 1", (fh,)).fetchone()
-                    if not has_fts:
-                        name_tokens = norm_tokens(p.name) + norm_tokens(str(p.parent))
-                        fts_content = " ".join(name_tokens[:64])
-                        parse_jobs_pdf   = should_parse_pdf_jobs(p, cfg) if not job_id.startswith("Q") else False
-                        parse_quotes_pdf = should_parse_pdf_quotes_only(p, [str(r) for r in quotes_roots], q_year_min, q_year_max) if job_id.startswith("Q") else False
-                        if parse_jobs_pdf or parse_quotes_pdf:
-                            txt = extract_pdf_text(p, max_pages=max_pdf_pages, max_chars=max_pdf_chars)
-                            if txt: fts_content = (fts_content + " " + txt).strip()
-                        office_txt = extract_office_text(p, cfg)
-                        if office_txt: fts_content = (fts_content + " " + office_txt).strip()
-                        fts_batch.append((fts_content, fh)); counters["fts_backfilled"] += 1
-                        if len(fts_batch) >= 800:
-                            upsert_fts_rows(con, fts_batch); con.commit(); fts_batch.clear()
-                seen_hashes.add(fh); counters["skipped_unchanged"] += 1
-                continue
+                    if old_ns is None:
+                        ns_fill.append((mtime_ns, fh))
+                        if len(ns_fill) >= BATCH_ROWS:
+                            begin_write(con); fill_mtime_ns(con, ns_fill); con.commit(); ns_fill.clear()
+                    if fk not in fts_hashes:
+                        queue_fts(fh, " ".join(fname_tokens(name, parent)[:64]), path_s, ext, size,
+                                  wants_pdf_text(plow, ext, job_id, qver, jobs_pdf, pdf_allow_re))
+                        fts_hashes.add(fk); counters["fts_backfilled"] += 1
+                        if len(fts_batch) >= BATCH_ROWS:
+                            flush_batches()
+                if old_rel == rel:
+                    seen_hashes.add(fk); counters["skipped_unchanged"] += 1
+                    continue
+                # stored relative to an older job root (DBs from before job_root came from the
+                # job-id match): re-upsert so rel_path and jobs.root_path agree again; text is kept
+                rel_only = True
 
         # ensure job row
-        if job_id not in per_job_seen_roots:
-            per_job_seen_roots[job_id] = str(job_root)
+        seen_root = per_job_seen_roots.get(job_id)
+        if seen_root is None:
+            per_job_seen_roots[job_id] = job_root
             if not args.dry_run:
-                ensure_job(con, job_id, str(job_root), jy)
+                begin_write(con)
+                ensure_job(con, job_id, job_root, jy)
+        elif job_root < seen_root:
+            # a job whose files sit under several roots (e.g. Q9185 and Q9185.2) keeps the
+            # smallest, so the stored root doesn't depend on the concurrent walk's order
+            per_job_seen_roots[job_id] = job_root
+            if not args.dry_run:
+                begin_write(con)
+                con.execute("UPDATE jobs SET root_path=? WHERE job_id=?", (job_root, job_id))
 
         # insert/queue this file
-        name_tokens = norm_tokens(p.name) + norm_tokens(str(p.parent))
-        hits = apply_detectors(name_tokens, ext, detectors)
-        kind = detect_kind(ext)
-
-        fr = FileRow(
-            file_hash16=fh, job_id=job_id, rel_path=rel, ext=ext, size_bytes=size,
-            mtime_utc=mtime_iso, kind=kind, tokens_fname=" ".join(name_tokens[:64]),
-            detector_hits=",".join(hits), q_version=(qver if (job_id.startswith("Q") and ext==".pdf") else None)
-        )
-        batch.append(fr); seen_hashes.add(fh); counters["indexed"] += 1
-
-        # FTS content
-        fts_content = fr.tokens_fname
-        parse_jobs_pdf   = should_parse_pdf_jobs(p, cfg) if not job_id.startswith("Q") else False
-        parse_quotes_pdf = should_parse_pdf_quotes_only(p, [str(r) for r in quotes_roots], q_year_min, q_year_max) if job_id.startswith("Q") else False
-        if parse_jobs_pdf or parse_quotes_pdf:
-            txtc = extract_pdf_text(p, max_pages=max_pdf_pages, max_chars=max_pdf_chars)
-            if txtc: fts_content = (fts_content + " " + txtc).strip()
-        office_txt = extract_office_text(p, cfg)
-        if office_txt: fts_content = (fts_content + " " + office_txt).strip()
-        if not args.dry_run:
-            fts_batch.append((fts_content, fh))
-
-        if len(batch) >= 800 and not args.dry_run:
-            upsert_files(con, batch); upsert_fts_rows(con, fts_batch); con.commit()
-            batch.clear(); fts_batch.clear()
-
-    # tail flush
-    if batch and not args.dry_run:
-        upsert_files(con, batch); upsert_fts_rows(con, fts_batch); con.commit()
-        batch.clear(); fts_batch.clear()
+        tokens_fname, hits, kind, bits, is_compress, is_ame = classify(name, parent, ext, detectors)
+        batch.append((fh, job_id, rel, ext, size, utc_iso(st.st_mtime), kind, tokens_fname, hits, 0,
+                      qver if (job_id.startswith("Q") and ext == ".pdf") else None, bits,
+                      is_compress, is_ame, mtime_ns))
+        seen_hashes.add(fk); counters["indexed"] += 1
+
+        # FTS content (nothing reads it on a dry run, so skip the extraction too)
+        if not args.dry_run and not rel_only:
+            queue_fts(fh, tokens_fname, path_s, ext, size,
+                      wants_pdf_text(plow, ext, job_id, qver, jobs_pdf, pdf_allow_re))
+            fts_hashes.add(fk)
+
+        if len(batch) >= BATCH_ROWS and not args.dry_run:
+            flush_batches()
+
+    # tail flush (also commits job rows / FTS backfill / mtime_ns fills still pending)
+    if not args.dry_run:
+        begin_write(con); upsert_files(con, batch); drop_file_text(con, text_stale)
+        upsert_fts_rows(con, fts_batch); fill_mtime_ns(con, ns_fill)
+        con.commit()
+        batch.clear(); text_stale.clear(); fts_batch.clear(); ns_fill.clear()
+    if bulk_load:
+        create_files_indexes(con)
+
+    # ---------- phase 2: PDF/Office text (CPU-bound, in worker processes) ----------
+    if text_todo:
+        texts = iter_file_texts(text_todo, max_pdf_pages, max_pdf_chars, max_pdf_bytes, office_cfg, text_workers)
+        for (fh, _path, _size, head), txt in tqdm(texts, total=len(text_todo), desc="Text"):
+            fts_batch.append((fts_join(head, txt), fh))
+            if len(fts_batch) >= BATCH_ROWS:
+                begin_write(con); upsert_fts_rows(con, fts_batch); con.commit(); fts_batch.clear()
+        begin_write(con); upsert_fts_rows(con, fts_batch); con.commit(); fts_batch.clear()
+        text_todo.clear()
+    if fts_bulk:
+        begin_write(con); rebuild_fts_index(con); con.commit()
 
     # delete-pass only on complete scans of all roots (safety)
-    deleted = 0
+    deleted, deleted_jobs = 0, set()
     complete_scan = (args.limit == 0)
     if not args.dry_run and complete_scan and not args.no_delete and not args.quotes_only:
-        deleted = mark_deleted_missing(con, seen_hashes, args.year_min, args.year_max)
-
-    # ALWAYS roll up flags for jobs touched this run (includes quotes-only)
+        begin_write(con)
+        deleted, deleted_jobs = mark_deleted_missing(con, seen_hashes, args.year_min, args.year_max)
+        con.commit()
+    if rekey_to is not None:
+        begin_write(con)
+        con.executemany("INSERT OR IGNORE INTO rekey VALUES (?, ?)", rekey_batch); rekey_batch.clear()
+        dropped, dropped_jobs = rekey_files(con, rekey_to)
+        con.commit()
+        deleted_jobs |= dropped_jobs
+        print(f"[indexer] file keys re-hashed (user_version {algo} -> {rekey_to}); "
+              f"{dropped:,} rows not seen by this scan dropped", flush=True)
+
+    # ALWAYS roll up flags/counts for jobs touched this run (includes quotes-only),
+    # including jobs that only lost files
     if not args.dry_run:
-        for job_id in per_job_seen_roots.keys():
-            rollup_job_stats(con, job_id)
+        begin_write(con)
+        rollup_job_stats(con, per_job_seen_roots.keys() | deleted_jobs)
 
         # Enforce newest Q-PDF only in FTS
         cleanup_old_quote_versions(con)
@@ -786,7 +1459,8 @@ def main():
           f"fts_backfilled={counters['fts_backfilled']:,}; skipped_no_job={counters['skipped_no_job']:,}; "
           f"skipped_unchanged={counters['skipped_unchanged']:,}; skipped_out_of_year={counters['skipped_out_of_year']:,}; "
           f"skipped_ignored_ext={counters['skipped_ignored_ext']:,}; skipped_ignored_dir={counters['skipped_ignored_dir']:,}; "
-          f"deleted_marked={deleted:,} in {dur:,.1f}s")
+          f"deleted_marked={deleted:,} in {dur:,.1f}s", flush=True)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # PDF worker processes under a PyInstaller build
     main()
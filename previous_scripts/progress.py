@@ -1,34 +1,75 @@
-import os, time, sqlite3
+import os, sys, time, sqlite3
 DB = r"P:\Chris\Tankfinder\tankfinder.db"  # fix path/casing if needed
 
+def enable_vt() -> bool:
+    # Windows console: turn on ANSI escape handling (ENABLE_VIRTUAL_TERMINAL_PROCESSING)
+    try:
+        import ctypes
+        k32 = ctypes.windll.kernel32
+        h = k32.GetStdHandle(-11)  # STD_OUTPUT_HANDLE
+        mode = ctypes.c_uint32()
+        return bool(k32.GetConsoleMode(h, ctypes.byref(mode)) and k32.SetConsoleMode(h, mode.value | 0x4))
+    except Exception:
+        return False
+
+# ANSI clear + cursor home is one write; None -> spawn "cls" as before
+_CLEAR = "\x1b[2J\x1b[H" if os.name != "nt" or os.environ.get("WT_SESSION") or enable_vt() else None
+
+# One read-only connection for the whole session, so its page cache survives between polls
+_CON = None
+
+def connect():
+    global _CON
+    _CON = sqlite3.connect(f"file:{DB}?mode=ro", uri=True, check_same_thread=False)
+    _CON.executescript("PRAGMA query_only=1; PRAGMA cache_size=-20000; "
+                       "PRAGMA mmap_size=268435456; PRAGMA temp_store=MEMORY;")
+
+def close():
+    global _CON
+    if _CON is not None:
+        _CON.close()
+        _CON = None
+
 def snap():
-    con = sqlite3.connect(DB)
-    c = con.cursor()
-    jobs = c.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
-    files = c.execute("SELECT COUNT(*) FROM files WHERE deleted=0").fetchone()[0]
-    fts   = c.execute("SELECT COUNT(*) FROM fts_files").fetchone()[0]
-    last  = c.execute("SELECT job_id,last_seen FROM jobs ORDER BY last_seen DESC LIMIT 1").fetchone()
-    con.close()
-    return jobs, files, fts, (last or ("-", "-"))
+    # all four figures in one statement (one step / one fetch per poll)
+    row = _CON.execute("""
+      SELECT (SELECT COUNT(*) FROM jobs),
+             (SELECT COUNT(*) FROM files WHERE deleted=0),
+             (SELECT COUNT(*) FROM fts_files),
+             l.job_id, l.last_seen
+      FROM (SELECT 1) LEFT JOIN (SELECT job_id, last_seen FROM jobs ORDER BY last_seen DESC LIMIT 1) l
+    """).fetchone()
+    return row[0], row[1], row[2], (row[3:] if row[3] is not None else ("-", "-"))
 
 def main():
     prev = None
-    while True:
-        try:
-            jobs, files, fts, last = snap()
-        except Exception as e:
-            jobs=files=fts=0; last=("-", f"{e}")
-        os.system("cls")
-        print("TankFinder progress (read-only)\n")
-        print(f"Jobs: {jobs:,}")
-        print(f"Files (active): {files:,}")
-        print(f"FTS rows: {fts:,}")
-        print(f"Most recently seen job: {last[0]}  @ {last[1]}")
-        if prev:
-            dj = jobs - prev[0]; df = files - prev[1]; dt = fts - prev[2]
-            print(f"\nΔ since last refresh: jobs {dj:+}, files {df:+}, fts {dt:+}")
-        prev = (jobs, files, fts)
-        time.sleep(5)
+    try:
+        while True:
+            try:
+                if _CON is None:
+                    connect()
+                jobs, files, fts, last = snap()
+            except Exception as e:
+                close()  # reopen on the next poll (e.g. DB not created yet)
+                jobs=files=fts=0; last=("-", f"{e}")
+            if _CLEAR:
+                sys.stdout.write(_CLEAR)
+            else:
+                os.system("cls")
+            print("TankFinder progress (read-only)\n")
+            print(f"Jobs: {jobs:,}")
+            print(f"Files (active): {files:,}")
+            print(f"FTS rows: {fts:,}")
+            print(f"Most recently seen job: {last[0]}  @ {last[1]}")
+            if prev:
+                dj = jobs - prev[0]; df = files - prev[1]; dt = fts - prev[2]
+                print(f"\nΔ since last refresh: jobs {dj:+}, files {df:+}, fts {dt:+}")
+            prev = (jobs, files, fts)
+            time.sleep(5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close()
 
 if __name__ == "__main__":
     main()
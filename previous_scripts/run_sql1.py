@@ -1,43 +1,74 @@
 # run_sql.py — run a .sql file against tankfinder.db, print & save CSVs
-import sys, sqlite3, pathlib, csv, time
+import sys, sqlite3, pathlib, csv, re, time
 
 ROOT = pathlib.Path(__file__).parent
 DB   = ROOT / "tankfinder.db"
 OUT  = ROOT / "SQL_results"; OUT.mkdir(exist_ok=True)
 
+# Write statements share one transaction, opened before the first of them (a commit per
+# statement is an fsync each). Statements that must run outside a transaction, or that manage
+# it themselves, commit that batch first and run as written: after a script's own BEGIN, its
+# statements are in its transaction until its COMMIT; one it leaves open is rolled back.
+FIRST_WORD = re.compile(r"\s*(?:(?:--[^\n]*(?:\n|$)|/\*.*?\*/)\s*)*(\w+)", re.S)
+READ_ONLY  = {"SELECT", "VALUES", "EXPLAIN"}
+NO_TXN     = {"BEGIN", "COMMIT", "END", "ROLLBACK", "SAVEPOINT", "RELEASE",
+              "VACUUM", "PRAGMA", "ATTACH", "DETACH"}
+
 def main(sql_path: pathlib.Path):
     sql = sql_path.read_text(encoding="utf-8")
-    con = sqlite3.connect(DB)
+    con = sqlite3.connect(DB, isolation_level=None)
     cur = con.cursor()
     stamp = time.strftime("%Y%m%d-%H%M%S")
     idx = 0
+    own_txn = False  # the open transaction is ours, not the script's
 
     def run(stmt: str):
-        nonlocal idx
+        nonlocal idx, own_txn
         stmt = stmt.strip()
         if not stmt:
             return
         idx += 1
+        m = FIRST_WORD.match(stmt)
+        word = m.group(1).upper() if m else ""
+        if word in NO_TXN:
+            if own_txn:
+                con.commit(); own_txn = False
+        elif word not in READ_ONLY and not con.in_transaction:
+            cur.execute("BEGIN"); own_txn = True
         try:
             cur.execute(stmt)
             if cur.description:
                 cols = [c[0] for c in cur.description]
-                rows = cur.fetchall()
                 print(f"\n-- Result {idx}: {stmt.replace(chr(10),' ')[:120]}")
-                print("\t".join(cols))
-                for r in rows:
-                    print("\t".join("" if v is None else str(v) for v in r))
+                # tab-separated on screen (quoted when a cell holds a tab/newline), comma CSV on disk;
+                # "\n" because stdout is a text stream that translates newlines itself
+                tsv = csv.writer(sys.stdout, dialect="excel-tab", lineterminator="\n")
+                tsv.writerow(cols)
+                # stream: each row is printed and written as it is stepped, never held as a list
                 out = OUT / f"{sql_path.stem}_{stamp}_{idx:02}.csv"
                 with out.open("w", newline="", encoding="utf-8") as f:
-                    w = csv.writer(f); w.writerow(cols); w.writerows(rows)
+                    w = csv.writer(f); w.writerow(cols)
+                    for r in cur:
+                        tsv.writerow(r)
+                        w.writerow(r)
                 print(f"[saved] {out}")
             else:
                 print(f"\n-- OK ({cur.rowcount} row(s) affected)")
         except Exception as e:
             print(f"\n[error] {e}\n  in: {stmt}")
 
-    for stmt in sql.split(";"):
-        run(stmt)
+    # Statements end at a ';' that completes them, so ';' inside literals or trigger bodies is kept.
+    buf = ""
+    for piece in sql.split(";"):
+        buf += piece
+        if sqlite3.complete_statement(buf + ";"):
+            run(buf)
+            buf = ""
+        else:
+            buf += ";"
+    run(buf)  # unterminated remainder: let SQLite report it
+    if own_txn:
+        con.commit()
 
     con.close()
 
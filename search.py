@@ -6,51 +6,16 @@ Examples:
   python search.py "floating roof" --years 2018-2022
   python search.py --job 092-25 --show-files
 """
-import argparse, re, sqlite3, sys
+import argparse, sqlite3, sys
 from pathlib import Path
 
+from app.search_sql import build_match_expr, year_filters  # shared with the GUI
+
 ROOT = Path(__file__).resolve().parents[0]
 DB_PATH = ROOT / "tankfinder.db"
 
-def build_match_expr(q: str, near: int | None) -> str:
-    """
-    Build an FTS5 MATCH expression.
-    - If near is provided, chain terms with NEAR (no distance to avoid parser issues in some builds).
-    - Otherwise AND all tokens.
-    """
-    toks = [t for t in re.split(r"\W+", q.lower()) if t]
-    if not toks:
-        return ""
-    if near and len(toks) >= 2:
-        # Use plain NEAR (default distance). Some SQLite builds error on "NEAR/N" via bound params.
-        expr = f"\"{toks[0]}\""
-        for t in toks[1:]:
-            expr += f" NEAR \"{t}\""
-        return expr
-    # default: AND all tokens
-    return " AND ".join(f"\"{t}\"" for t in toks)
-
-def year_filters(years: str | None) -> list[str]:
-    """
-    Turn '2019-2022,2024' into LIKE filters on jobs.root_path (Windows path uses backslashes).
-    """
-    if not years:
-        return []
-    parts: list[str] = []
-    for chunk in years.split(","):
-        chunk = chunk.strip()
-        if "-" in chunk:
-            a, b = chunk.split("-", 1)
-            try:
-                a = int(a); b = int(b)
-                for y in range(min(a, b), max(a, b) + 1):
-                    parts.append(str(y))
-            except ValueError:
-                continue
-        else:
-            if chunk.isdigit():
-                parts.append(chunk)
-    return [f"j.root_path LIKE '%\\{y}\\%'" for y in sorted(set(parts))]
+# AS MATERIALIZED (SQLite 3.35+) keeps a CTE from being flattened into the outer join
+MATERIALIZED = "MATERIALIZED" if sqlite3.sqlite_version_info >= (3, 35, 0) else ""
 
 def main():
     ap = argparse.ArgumentParser(description="TankFinder search (CLI)")
@@ -75,18 +40,19 @@ def main():
     where = []
     params = []
 
-    # Build the FTS join & predicate for the main query
+    # FTS rowid == files.id on current DBs; older ones only share the text hash (and may hold
+    # duplicate FTS rows per file, so they count distinct files)
+    files_cols = {r[1] for r in con.execute("PRAGMA table_info(files)")}
+    if "id" in files_cols:
+        fts_on, n_hits = "f.id = h.rowid", "COUNT(*)"
+    else:
+        fts_on, n_hits = "f.file_hash16 = h.file_hash16", "COUNT(DISTINCT f.file_hash16)"
+
     if args.query:
-        match_expr = build_match_expr(args.query, args.near)
+        match_expr = build_match_expr(args.query, use_near=bool(args.near))
         if not match_expr:
             print("No valid terms in query.", file=sys.stderr); sys.exit(1)
-        fts_join = "JOIN fts_files ff ON ff.file_hash16 = f.file_hash16"
-        fts_pred = "ff.content MATCH ?"
         params.append(match_expr)
-    else:
-        # No query: don't require an FTS row
-        fts_join = "LEFT JOIN fts_files ff ON ff.file_hash16 = f.file_hash16"
-        fts_pred = "1=1"
 
     # Job-level filters
     if args.job:
@@ -95,37 +61,86 @@ def main():
     if args.ame:      where.append("j.has_ame = 1")
     if args.cad:      where.append("j.has_dwg_dxf = 1")
     if args.pdf:      where.append("j.has_pdf = 1")
-    year_like = year_filters(args.years)
-    if year_like:
-        where.append("(" + " OR ".join(year_like) + ")")
-
-    where_sql = " AND ".join([fts_pred] + where) if where else fts_pred
-
-    # Aggregate to jobs (rank by number of matching files)
-    sql = f"""
-    WITH hits AS (
-      SELECT DISTINCT f.job_id, f.file_hash16
-      FROM files f
-      {fts_join}
-      JOIN jobs j ON j.job_id = f.job_id
-      WHERE f.deleted = 0 AND {where_sql}
-    )
-    SELECT j.job_id,
-           j.root_path,
-           j.has_compress, j.has_ame, j.has_dwg_dxf, j.has_pdf,
-           COUNT(h.file_hash16) AS n_hits
-    FROM hits h
-    JOIN jobs j ON j.job_id = h.job_id
-    GROUP BY j.job_id, j.root_path, j.has_compress, j.has_ame, j.has_dwg_dxf, j.has_pdf
-    ORDER BY n_hits DESC, j.job_id
-    LIMIT ?
-    """
+    yf = year_filters(args.years)
+    if yf:
+        where.append(yf[0]); params.extend(yf[1])
+
+    where_sql = " AND ".join(["f.deleted = 0"] + where)
+
+    # Aggregate to jobs (rank by number of matching files, then by best BM25 score)
+    if args.query:
+        # MATCH runs alone in a materialized CTE: mixed with predicates on joined tables,
+        # the planner can drop the FTS index for a scan. Every match is kept, so counts stay exact.
+        sql = f"""
+        WITH fts_hits AS {MATERIALIZED} (
+          SELECT rowid, file_hash16, bm25(fts_files) AS score
+          FROM fts_files
+          WHERE content MATCH ?
+        )
+        SELECT j.job_id,
+               j.root_path,
+               j.has_compress, j.has_ame, j.has_dwg_dxf, j.has_pdf,
+               {n_hits} AS n_hits,
+               MIN(h.score) AS best_score
+        FROM fts_hits h
+        JOIN files f ON {fts_on}
+        JOIN jobs j ON j.job_id = f.job_id
+        WHERE {where_sql}
+        GROUP BY j.job_id
+        ORDER BY n_hits DESC, best_score, j.job_id
+        LIMIT ?
+        """
+    else:
+        # No query: no FTS table at all
+        sql = f"""
+        SELECT j.job_id,
+               j.root_path,
+               j.has_compress, j.has_ame, j.has_dwg_dxf, j.has_pdf,
+               COUNT(*) AS n_hits
+        FROM files f
+        JOIN jobs j ON j.job_id = f.job_id
+        WHERE {where_sql}
+        GROUP BY j.job_id
+        ORDER BY n_hits DESC, j.job_id
+        LIMIT ?
+        """
     rows = con.execute(sql, (*params, args.limit)).fetchall()
     if not rows:
         print("No results.")
         con.close()
         return
 
+    # Listing SQL is built once: identical text hits sqlite3's statement cache on every job,
+    # so it is parsed and planned a single time
+    if args.show_files:
+        if args.query:
+            # One MATCH for the whole listing: hits land in a temp table indexed by job,
+            # instead of re-running the FTS query for every job shown
+            con.execute(f"""
+            CREATE TEMP TABLE _hits AS
+            SELECT f.job_id, f.rel_path
+            FROM (SELECT rowid, file_hash16 FROM fts_files WHERE content MATCH ?) h
+            JOIN files f ON {fts_on}
+            WHERE f.deleted=0
+            """, (params[0],))
+            con.execute("CREATE INDEX temp._hits_job ON _hits(job_id, rel_path)")
+            files_sql = """
+            SELECT rel_path
+            FROM _hits
+            WHERE job_id=?
+            ORDER BY rel_path
+            LIMIT 50
+            """
+        else:
+            files_sql = """
+            SELECT f.rel_path
+            FROM files f
+            WHERE f.deleted=0 AND f.job_id=?
+            ORDER BY f.rel_path
+            LIMIT 50
+            """
+        cur = con.cursor()
+
     # Print job summary
     for r in rows:
         badges = []
@@ -137,27 +152,7 @@ def main():
 
         # Optionally list the matching files for each job
         if args.show_files:
-            if args.query:
-                files_sql = """
-                SELECT f.rel_path
-                FROM files f
-                JOIN fts_files ff ON ff.file_hash16 = f.file_hash16
-                WHERE f.deleted=0 AND f.job_id=? AND ff.content MATCH ?
-                ORDER BY f.rel_path
-                LIMIT 50
-                """
-                file_params = (r["job_id"], params[0])
-            else:
-                files_sql = """
-                SELECT f.rel_path
-                FROM files f
-                WHERE f.deleted=0 AND f.job_id=?
-                ORDER BY f.rel_path
-                LIMIT 50
-                """
-                file_params = (r["job_id"],)
-
-            for fr in con.execute(files_sql, file_params):
+            for fr in cur.execute(files_sql, (r["job_id"],)):
                 print(f"   - {fr['rel_path']}")
 
     con.close()
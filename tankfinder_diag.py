@@ -103,11 +103,29 @@ def main(db_path: str):
     except Exception:
         pass
 
+    # 6) Search text coverage: every live file should have a file_text row, except older quote
+    # PDF versions (the indexer keeps only the newest per quote in FTS)
+    try:
+        con3 = sqlite3.connect(db_path, timeout=2, isolation_level=None)
+        missing = con3.execute("""
+          SELECT COUNT(*) FROM files f
+          WHERE f.deleted=0
+            AND NOT EXISTS (SELECT 1 FROM file_text t WHERE t.file_hash16=f.file_hash16)
+            AND NOT (f.job_id LIKE 'Q%' AND f.ext='.pdf' AND COALESCE(f.q_version,0) <
+                     (SELECT MAX(COALESCE(x.q_version,0)) FROM files x
+                      WHERE x.job_id=f.job_id AND x.ext='.pdf' AND x.deleted=0))
+        """).fetchone()[0]
+        p(f"[FTS] live files without search text: {missing:,}")
+        con3.close()
+    except Exception as e:
+        p(f"[FTS] coverage check failed: {e!r}")
+
     p("\n=== Guidance ===")
     p("- If journal_mode != WAL, we should switch to WAL so GUI reads don't block on writer.")
     p("- If 'Writer active now: True', the indexer has a transaction open (big batch, VACUUM, or long write).")
     p("- Nonzero 'WAL size' with large 'log' in checkpoint result suggests long-uncheckpointed WAL; short commits help.")
     p("- If RO fails but RW works, permissions or path mapping might be off.")
+    p("- Files without search text are normal right after a --skip-text or interrupted run; otherwise they point at an indexer bug.")
     p("Paste this entire output to me.")
 
 if __name__ == "__main__":
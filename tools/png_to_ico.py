@@ -5,5 +5,16 @@ src = Path(r"P:\Chris\TankFinder\assets\tankfinder.png")
 dst = Path(r"P:\Chris\TankFinder\assets\tankfinder.ico")
 
 img = Image.open(src).convert("RGBA")
-img.save(dst, sizes=[(16,16),(24,24),(32,32),(48,48),(64,64),(128,128),(256,256)])
+# Downscale largest-first, each step from the previous (smaller) frame, and hand ICO the finished frames.
+# Like Pillow's own ICO sizing: aspect ratio kept (thumbnail), no size larger than the source
+src_w, src_h = img.size
+frames = []
+for s in [256, 128, 64, 48, 32, 24, 16]:
+    if s > src_w or s > src_h:
+        continue
+    img = img.copy()
+    img.thumbnail((s, s), Image.LANCZOS, reducing_gap=None)
+    frames.append(img)
+# sizes are the frames' own, so the writer stores them as given instead of rescaling
+frames[0].save(dst, format="ICO", append_images=frames[1:], sizes=[f.size for f in frames])
 print("Wrote", dst)